@@ -0,0 +1,396 @@
+"""Benchmarks hors ligne : python -m benchmarks.run [--only chat_e2e ...] [--compare benchmarks/results/<run>.json]
+
+Tout tourne dans un répertoire temporaire, contre le serveur Ollama factice de benchmarks/stub_ollama.py.
+Les résultats sont écrits en JSON dans benchmarks/results/ pour être comparés d'un run à l'autre.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stub_ollama import StubSettings, start_stub_server
+
+VOCABULARY = (
+    "analyse donnees modele contrat article client service rapport budget projet "
+    "document recherche reseau securite serveur stockage index requete reponse systeme"
+).split()
+
+def synthetic_text(words: int, seed: int = 0) -> str:
+    """Texte pseudo-aléatoire reproductible, en phrases de 8 à 20 mots"""
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+def write_pdf(path: Path, pages: List[str], line_length: int = 90) -> None:
+    """PDF minimal (Helvetica, une ligne de texte par Tj), lisible par pypdf et pdfplumber"""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, rempli une fois les pages numérotées
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    page_ids = []
+    for text in pages:
+        lines = [text[i:i + line_length] for i in range(0, len(text), line_length)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        stream_bytes = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream_bytes) + stream_bytes + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+    )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    path.write_bytes(bytes(output))
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+
+    def at(p: float) -> float:
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+
+    return {
+        "runs": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": at(0.5),
+        "p99_ms": at(0.99)
+    }
+
+def repeat(fn: Callable, runs: int) -> List[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# --- Benchmarks -------------------------------------------------------------------------
+
+def bench_pdf_extraction(ctx: Dict) -> Dict:
+    from src.rag.pdf_extraction import extract_pdf_pages
+    pdf_path = ctx["pdf_path"]
+    # Premier appel à part : démarrage du pool de processus
+    asyncio.run(extract_pdf_pages(str(pdf_path)))
+    samples = repeat(lambda: asyncio.run(extract_pdf_pages(str(pdf_path))), ctx["runs"])
+    result = percentiles(samples)
+    result["pages"] = ctx["pages"]
+    result["pages_per_second"] = round(ctx["pages"] / (result["mean_ms"] / 1000), 1)
+    return result
+
+def bench_chunking(ctx: Dict) -> Dict:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    text = ctx["text"]
+    chunks = splitter.split_text(text)
+    result = percentiles(repeat(lambda: splitter.split_text(text), ctx["runs"]))
+    result["chunks"] = len(chunks)
+    result["mb_per_second"] = round(len(text.encode("utf-8")) / 1e6 / (result["mean_ms"] / 1000), 2)
+    return result
+
+def bench_analyzer(ctx: Dict) -> Dict:
+    from src.rag.document_analyzer import DocumentAnalyzer
+    analyzer = DocumentAnalyzer()
+    text = ctx["text"]
+    analyzer.analyze_document(text)
+    result = percentiles(repeat(lambda: analyzer.analyze_document(text), ctx["runs"]))
+    result["chars_per_second"] = round(len(text) / (result["mean_ms"] / 1000))
+    return result
+
+def bench_embedding(ctx: Dict) -> Dict:
+    from src.llm.ollama_client import OllamaClient
+    from src.rag.embeddings import EmbeddingEngine, OllamaClientEmbeddings
+    texts = [synthetic_text(150, seed=i) for i in range(ctx["embedding_texts"])]
+
+    async def run() -> float:
+        client = OllamaClient(base_url=ctx["ollama_url"])
+        try:
+            # Sans cache : on mesure le débit des lots envoyés à Ollama
+            engine = EmbeddingEngine(OllamaClientEmbeddings(client))
+            started = time.perf_counter()
+            async for _ in engine.embed_stream(texts):
+                pass
+            return time.perf_counter() - started
+        finally:
+            await client.aclose()
+
+    elapsed = asyncio.run(run())
+    return {
+        "texts": len(texts),
+        "seconds": round(elapsed, 3),
+        "texts_per_second": round(len(texts) / elapsed, 1)
+    }
+
+def bench_faiss_search(ctx: Dict) -> Dict:
+    import numpy as np
+    from src.rag.ann_index import evaluate_specs
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((ctx["faiss_vectors"], ctx["dimension"])).astype(np.float32)
+    queries = rng.standard_normal((ctx["faiss_queries"], ctx["dimension"])).astype(np.float32)
+    return {"specs": evaluate_specs(ctx["faiss_specs"], vectors, queries, k=10)}
+
+@contextmanager
+def serve_app(app):
+    """Lance l'application dans un serveur uvicorn local et fournit un client httpx vers celui-ci"""
+    import httpx
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Le serveur uvicorn n'a pas démarré")
+        time.sleep(0.05)
+
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join()
+
+def bench_chat_e2e(ctx: Dict) -> Dict:
+    from src.main import app
+
+    documents_dir = Path(os.getcwd()) / "documents"
+    documents_dir.mkdir(exist_ok=True)
+    (documents_dir / "benchmark.pdf").write_bytes(ctx["pdf_path"].read_bytes())
+
+    with serve_app(app) as client:
+        def chat(message: str, use_rag: bool) -> None:
+            response = client.post("/api/chat/", json={
+                "message": message,
+                "use_rag": use_rag,
+                "documents": ["benchmark.pdf"] if use_rag else []
+            })
+            response.raise_for_status()
+
+        # Premier appel RAG : ingestion complète du document
+        started = time.perf_counter()
+        chat("Question de préchauffage", True)
+        cold_rag_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        # Messages tous différents pour ne pas mesurer le cache de réponses
+        counter = iter(range(10 ** 6))
+        plain = percentiles(repeat(lambda: chat(f"Question {next(counter)} sans documents", False), ctx["chat_requests"]))
+        rag = percentiles(repeat(lambda: chat(f"Que dit le document sur le point {next(counter)} ?", True), ctx["chat_requests"]))
+    return {"cold_rag_ms": cold_rag_ms, "chat": plain, "chat_rag": rag}
+
+def stream_chat(client, message: str, conversation_id: Optional[str]) -> Dict:
+    """Envoie un message sur /api/chat/stream et retourne les données de l'événement done"""
+    event = None
+    with client.stream("POST", "/api/chat/stream", json={"message": message, "conversation_id": conversation_id}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[len("data: "):])
+                if event == "error":
+                    raise RuntimeError(data["detail"])
+                return data
+    raise RuntimeError("Flux interrompu avant l'événement done")
+
+def bench_chat_followup(ctx: Dict) -> Dict:
+    """TTFT des tours suivants d'une conversation, avec et sans reprise du contexte KV d'Ollama"""
+    from src.main import app
+
+    stub_settings = ctx["stub_settings"]
+    # L'évaluation du prompt n'est simulée qu'ici, pour ne pas fausser la comparaison des autres benchmarks
+    stub_settings.prefill_tokens_per_second = ctx["prefill_tokens_per_second"]
+    try:
+        with serve_app(app) as client:
+            def conversation(reuse_context: bool) -> List[float]:
+                app.state.conversation_memory.reuse_context = reuse_context
+                conversation_id = None
+                samples = []
+                for turn in range(ctx["followup_turns"]):
+                    done = stream_chat(client, f"Question {turn} sur le projet {reuse_context} et son budget", conversation_id)
+                    conversation_id = done["conversation_id"]
+                    if turn and done["ttft_ms"] is not None:
+                        samples.append(done["ttft_ms"] / 1000)
+                return samples
+
+            results = {
+                "without_kv_context": percentiles(conversation(False)),
+                "with_kv_context": percentiles(conversation(True))
+            }
+            app.state.conversation_memory.reuse_context = True
+            return results
+    finally:
+        stub_settings.prefill_tokens_per_second = 0.0
+
+BENCHMARKS = {
+    "pdf_extraction": bench_pdf_extraction,
+    "chunking": bench_chunking,
+    "analyzer": bench_analyzer,
+    "embedding": bench_embedding,
+    "faiss_search": bench_faiss_search,
+    "chat_e2e": bench_chat_e2e,
+    "chat_followup": bench_chat_followup
+}
+
+# --- Comparaison ------------------------------------------------------------------------
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    items = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            items.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            label = value.get("spec", i) if isinstance(value, dict) else i
+            items.update(flatten(value, f"{prefix}{label}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        items[prefix.rstrip(".")] = data
+    return items
+
+def compare(current: Dict, previous: Dict) -> List[str]:
+    before = flatten(previous["results"])
+    after = flatten(current["results"])
+    lines = []
+    for key in sorted(after.keys() & before.keys()):
+        if before[key]:
+            change = (after[key] - before[key]) / before[key] * 100
+            lines.append(f"{key:60} {before[key]:>12} -> {after[key]:>12} ({change:+.1f}%)")
+    return lines
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne du pipeline RAG")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks à lancer (défaut : tous)")
+    parser.add_argument("--compare", help="fichier de résultats précédent à comparer")
+    parser.add_argument("--output", help="fichier de sortie (défaut : benchmarks/results/<date>.json)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--words", type=int, default=50000, help="taille du texte pour chunking et analyse")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--embedding-texts", type=int, default=512)
+    parser.add_argument("--faiss-vectors", type=int, default=50000)
+    parser.add_argument("--faiss-queries", type=int, default=200)
+    parser.add_argument("--faiss-specs", nargs="+", default=["Flat", "HNSW32", "IVF256,Flat", "IVF256,PQ16", "SQ8"])
+    parser.add_argument("--chat-requests", type=int, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--followup-turns", type=int, default=10, help="tours par conversation pour chat_followup")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=2000.0,
+                        help="débit d'évaluation du prompt simulé dans chat_followup")
+    args = parser.parse_args()
+    # Chemins résolus avant de changer de répertoire de travail
+    output = Path(args.output).resolve() if args.output else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    compare_path = Path(args.compare).resolve() if args.compare else None
+
+    stub_settings = StubSettings(
+        dimension=args.dimension,
+        tokens_per_second=args.tokens_per_second,
+        latency=args.latency,
+        embed_latency=args.embed_latency,
+        tokens=args.tokens
+    )
+    stub = start_stub_server(stub_settings)
+    ollama_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    # La configuration est lue à l'import de src.config : tout pointe vers le répertoire temporaire
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama_url,
+        "VECTOR_STORE_PATH": str(workdir / "data" / "vector_store"),
+        "EMBEDDING_CACHE_PATH": str(workdir / "data" / "embedding_cache.sqlite"),
+        "EXTRACTION_CACHE_PATH": str(workdir / "data" / "extraction_cache.sqlite"),
+        "OBJECT_CACHE_PATH": str(workdir / "data" / "object_cache")
+    })
+    os.chdir(workdir)
+
+    pdf_path = workdir / "benchmark.pdf"
+    write_pdf(pdf_path, [synthetic_text(400, seed=page) for page in range(args.pages)])
+    ctx = {
+        **vars(args),
+        "ollama_url": ollama_url,
+        "stub_settings": stub_settings,
+        "pdf_path": pdf_path,
+        "text": synthetic_text(args.words)
+    }
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"▶ {name}", flush=True)
+        try:
+            results[name] = BENCHMARKS[name](ctx)
+        except Exception as e:
+            # Un benchmark en échec (dépendance absente...) n'empêche pas les autres
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(results[name], ensure_ascii=False), flush=True)
+    stub.shutdown()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("compare", "output", "only")},
+        "results": results
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Résultats écrits dans {output}")
+
+    if compare_path:
+        previous = json.loads(compare_path.read_text(encoding="utf-8"))
+        print(f"\nComparaison avec {args.compare} ({previous.get('commit')})")
+        for line in compare(report, previous):
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Serveur Ollama factice pour les benchmarks hors ligne : python -m benchmarks.stub_ollama --port 11435
+
+Implémente /api/generate (stream ou non), /api/embed et /api/tags. Les embeddings sont
+déterministes (dérivés du sha256 du texte) et la génération suit un débit de tokens configurable.
+"""
+import argparse
+import hashlib
+import json
+import math
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("le", "document", "indique", "que", "la", "réponse", "dépend", "du", "contexte", "fourni")
+
+def deterministic_embedding(text: str, dimension: int) -> list:
+    """Vecteur unitaire reproductible : même texte, même vecteur, sans dépendance à numpy"""
+    values = []
+    counter = 0
+    while len(values) < dimension:
+        digest = hashlib.sha256(f"{counter}\0{text}".encode("utf-8")).digest()
+        # 8 valeurs par bloc de 32 octets, centrées sur 0
+        values.extend(value / 2 ** 31 - 1 for value in struct.unpack("<8I", digest))
+        counter += 1
+    values = values[:dimension]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+class StubSettings:
+    def __init__(self, dimension: int = 768, tokens_per_second: float = 50.0, latency: float = 0.05,
+                 embed_latency: float = 0.01, tokens: int = 64, prefill_tokens_per_second: float = 0.0):
+        self.dimension = dimension
+        self.tokens_per_second = tokens_per_second
+        # Délai avant le premier token (chargement du prompt) et par appel d'embedding
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.tokens = tokens
+        # Débit d'évaluation du prompt (0 = instantané) ; les tokens repris de `context` ne sont pas réévalués
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    settings = StubSettings()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: dict) -> None:
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/api/embed":
+            self._embed(payload)
+        elif self.path == "/api/generate":
+            self._generate(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _embed(self, payload: dict) -> None:
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self.settings.embed_latency)
+        self._send_json({
+            "model": payload.get("model"),
+            "embeddings": [deterministic_embedding(text, self.settings.dimension) for text in texts]
+        })
+
+    def _generate(self, payload: dict) -> None:
+        settings = self.settings
+        if "prompt" not in payload:
+            # Préchargement du modèle : Ollama répond immédiatement, sans génération
+            self._send_json({"model": payload.get("model"), "done": True, "done_reason": "load", "response": ""})
+            return
+        options = payload.get("options") or {}
+        token_count = min(settings.tokens, int(options.get("num_predict") or settings.tokens))
+        prompt_tokens = len(payload.get("prompt", "").split())
+        interval = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(token_count)]
+        # Comme Ollama : le contexte renvoyé prolonge celui reçu, seul le nouveau prompt est évalué
+        context = list(payload.get("context") or [])
+        final = {
+            "model": payload.get("model"),
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": token_count,
+            "context": context + list(range(len(context), len(context) + prompt_tokens + token_count))
+        }
+
+        prefill = prompt_tokens / settings.prefill_tokens_per_second if settings.prefill_tokens_per_second > 0 else 0.0
+        time.sleep(settings.latency + prefill)
+        if not payload.get("stream", True):
+            time.sleep(interval * token_count)
+            self._send_json({**final, "response": "".join(tokens)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(interval)
+            self._write_chunk({"model": payload.get("model"), "response": token, "done": False})
+        self._write_chunk({**final, "response": ""})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def start_stub_server(settings: StubSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread ; port 0 = port libre, lisible dans server.server_address"""
+    handler = type("ConfiguredStubOllamaHandler", (StubOllamaHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serveur Ollama factice")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="délai avant le premier token (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="délai par appel /api/embed (s)")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens générés par réponse")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="débit d'évaluation du prompt (0 = instantané)")
+    args = parser.parse_args()
+
+    settings = StubSettings(args.dimension, args.tokens_per_second, args.latency, args.embed_latency, args.tokens,
+                            args.prefill_tokens_per_second)
+    server = start_stub_server(settings, args.host, args.port)
+    print(f"Stub Ollama sur http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from fastapi import Request
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import LLMScheduler
+from src.rag.conversation_memory import ConversationMemory
+from src.rag.conversation_store import ConversationStore
+from src.rag.ingestion import DocumentIngestor
+from src.rag.jobs import IngestionJobQueue
+from src.rag.response_cache import ResponseCache
+from src.warmup import Warmup
+
+# Les objets partagés sont créés une seule fois dans le lifespan de l'application (src/main.py)
+
+def get_ollama_client(request: Request) -> OllamaClient:
+    return request.app.state.ollama_client
+
+def get_ingestor(request: Request) -> DocumentIngestor:
+    return request.app.state.ingestor
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.response_cache
+
+def get_scheduler(request: Request) -> LLMScheduler:
+    return request.app.state.scheduler
+
+def get_job_queue(request: Request) -> IngestionJobQueue:
+    return request.app.state.job_queue
+
+def get_warmup(request: Request) -> Warmup:
+    return request.app.state.warmup
+
+def get_conversation_memory(request: Request) -> ConversationMemory:
+    return request.app.state.conversation_memory
+
+def get_conversation_store(request: Request) -> ConversationStore:
+    return request.app.state.conversation_store
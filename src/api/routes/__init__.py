@@ -1,2 +1,4 @@
 from . import chat
 from . import documents
+from . import metrics
+from . import health
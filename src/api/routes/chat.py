@@ -1,22 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import asyncio
+import json
+import time
+import uuid
 import logging
-from src.rag.conversation_store import ConversationStore
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_ollama import OllamaLLM
-from langchain.chains import ConversationalRetrievalChain
-from src.rag.document_loader import DocumentLoader
-from src.rag.vector_store import VectorStore
+from src.rag.conversation_memory import ConversationMemory, ConversationTurn
+from src.rag.conversation_store import ConversationStore, InvalidCursorError
+from src.config import DEFAULT_LLM_PARAMS, CONVERSATION_PAGE_SIZE, CONTEXT_PACKING_CONFIG, RETRIEVAL_TOP_K
+from langchain_core.documents import Document
+from src.rag.chat import format_context
+from src.rag.response_cache import ResponseCache, make_params_key, chunk_ids_of, sources_of
+from src.rag.context_packer import ContextPacker
+from src.rag.ingestion import DocumentIngestor
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import LLMScheduler, SchedulerOverloaded
+from src.api.dependencies import get_conversation_memory, get_conversation_store, get_ingestor, get_ollama_client, get_response_cache, get_scheduler
+from src.metrics import observe_stage, timed
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Créer les embeddings
-embeddings = OllamaEmbeddings(
-    model="llama2",
-    base_url="http://localhost:11434"
-)
+context_packer = ContextPacker()
 
 class ChatRequest(BaseModel):
     message: str
@@ -25,78 +32,277 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     documents: List[str] = []
 
-@router.post("/chat/")
-async def chat(request: ChatRequest):
-    try:
-        llm = OllamaLLM(
-            model="llama2",
-            base_url="http://localhost:11434",
-            temperature=0.3
-        )
+NO_DOCUMENT_RESPONSE = "Aucun document valide n'a été trouvé."
+
+def generation_options(request: ChatRequest) -> dict:
+    return {
+        "temperature": request.temperature,
+        "top_p": DEFAULT_LLM_PARAMS["top_p"],
+        "num_predict": DEFAULT_LLM_PARAMS["max_tokens"],
+        "num_ctx": CONTEXT_PACKING_CONFIG["context_window"]
+    }
+
+def conversation_turn(request: ChatRequest, memory: ConversationMemory, llm_client: OllamaClient) -> ConversationTurn:
+    """Contexte KV du tour précédent ou, à défaut, résumé glissant et derniers échanges"""
+    return memory.prepare(request.conversation_id, llm_client.model)
+
+def save_turn(
+    conversation_id: str,
+    request: ChatRequest,
+    response: str,
+    memory: ConversationMemory,
+    llm_client: OllamaClient,
+    context: Optional[List[int]] = None
+) -> None:
+    """Enregistre l'échange, le contexte KV produit et planifie le résumé des échanges anciens"""
+    memory.store.save_message(conversation_id, "user", request.message)
+    conversation = memory.store.save_message(conversation_id, "assistant", response)
+    # Le tour suivant repartira de ce contexte au lieu de réévaluer tout l'historique
+    memory.remember_context(conversation, llm_client.model, context)
+    # Les échanges qui ne tiennent plus dans le budget sont résumés après la réponse
+    memory.schedule_update(conversation_id)
+
+async def build_prompt(
+    request: ChatRequest,
+    ingestor: DocumentIngestor,
+    history: str = "",
+    context_tokens: int = 0
+) -> Tuple[Optional[str], List[Document]]:
+    """Construit le prompt envoyé au modèle (None si aucun document n'est exploitable) et retourne les chunks utilisés.
+
+    Avec un contexte KV repris (context_tokens), l'historique est déjà connu du modèle : history est vide.
+    """
+    if not (request.use_rag and request.documents):
+        if history:
+            return f"{history}\n\nQuestion : {request.message}", []
+        return request.message, []
+
+    available = await ingestor.ingest(request.documents)
+    if not available:
+        return None, []
 
-        if request.use_rag and request.documents:
-            document_loader = DocumentLoader()
-            documents = await document_loader.load_documents(request.documents)
-            
-            if not documents:
-                return {"response": "Aucun document valide n'a été trouvé."}
-
-            # Extraction du contenu avec plus de détails
-            document_contents = []
-            for doc in documents:
-                content = doc.page_content.strip()
-                if content:
-                    document_contents.append(content)
-
-            context = "\n\n".join(document_contents)
-            
-            enhanced_prompt = f"""Tu es un assistant précis et direct.
-
-Document analysé : {request.documents[0]}
-Contenu du document :
+    # Seuls les chunks les plus pertinents sont envoyés au modèle
+    candidates = await asyncio.to_thread(ingestor.retrieve, request.message, available, RETRIEVAL_TOP_K * 2)
+    if not candidates:
+        return None, []
+
+    history_section = f"Historique de la conversation :\n{history}\n\n" if history else ""
+
+    def render(context: str, history_section: str = history_section) -> str:
+        return f"""Tu es un assistant précis et direct.
+
+{history_section}Documents analysés : {", ".join(available)}
+Extraits pertinents des documents :
 {context}
 
 Question : {request.message}
 
 Instructions :
-1. Décris exactement ce qu'est ce fichier (type, nom, contenu principal)
-2. Résume brièvement les informations principales qu'il contient
-3. Si tu ne peux pas lire certaines parties, indique-le clairement
+1. Réponds à la question en t'appuyant sur les extraits fournis
+2. Cite la source des informations utilisées
+3. Si l'information n'est pas dans les extraits, indique-le clairement
 
 Réponds en français de manière concise et structurée."""
 
-            response = await llm.ainvoke(enhanced_prompt)
-            return {"response": response}
-        else:
-            response = await llm.ainvoke(request.message)
-            return {"response": response}
+    # Les chunks sont retenus sous le budget de tokens restant une fois le gabarit et la sortie réservés
+    with timed("prompt_build"):
+        budget = context_packer.budget(render("", ""), history, context_tokens)
+        relevant_docs = await context_packer.apack_for_query(
+            candidates, budget, request.message, ingestor.vector_store.embeddings
+        )
+        prompt = render(format_context(relevant_docs)) if relevant_docs else None
+    if prompt is None:
+        return None, []
+
+    return prompt, relevant_docs
+
+class CacheKey:
+    """Clé de cache sémantique d'une requête de chat"""
+
+    def __init__(self, query_vector: List[float], docs: List[Document], params_key: str):
+        self.query_vector = query_vector
+        self.chunk_ids = chunk_ids_of(docs)
+        self.sources = sources_of(docs)
+        self.params_key = params_key
+
+async def lookup_cached_response(
+    request: ChatRequest,
+    docs: List[Document],
+    ingestor: DocumentIngestor,
+    llm_client: OllamaClient,
+    response_cache: ResponseCache,
+    has_history: bool = False
+) -> Tuple[Optional[str], Optional[CacheKey]]:
+    if has_history:
+        # La réponse dépend aussi de l'historique : le cache ne sert qu'aux débuts de conversation
+        return None, None
+    query_vector = await ingestor.vector_store.embeddings.aembed_query(request.message)
+    key = CacheKey(query_vector, docs, make_params_key(llm_client.model, generation_options(request)))
+    return response_cache.lookup(key.query_vector, key.chunk_ids, key.params_key, key.sources), key
+
+def store_cached_response(response_cache: ResponseCache, key: Optional[CacheKey], response: str) -> None:
+    if key is None:
+        return
+    response_cache.put(key.query_vector, key.chunk_ids, key.params_key, key.sources, response)
 
+@router.post("/chat/")
+async def chat(
+    request: ChatRequest,
+    ingestor: DocumentIngestor = Depends(get_ingestor),
+    llm_client: OllamaClient = Depends(get_ollama_client),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    memory: ConversationMemory = Depends(get_conversation_memory)
+):
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    try:
+        turn = conversation_turn(request, memory, llm_client)
+        prompt, docs = await build_prompt(request, ingestor, turn.history, len(turn.context or []))
+        if prompt is None:
+            return {"response": NO_DOCUMENT_RESPONSE, "cached": False, "conversation_id": conversation_id}
+
+        response, cache_key = await lookup_cached_response(
+            request, docs, ingestor, llm_client, response_cache, turn.has_history
+        )
+        cached = response is not None
+        result = {}
+        if not cached:
+            result = await llm_client.generate(prompt, generation_options(request), context=turn.context)
+            response = result.get("response", "")
+            store_cached_response(response_cache, cache_key, response)
+
+        save_turn(conversation_id, request, response, memory, llm_client, result.get("context"))
+        return {"response": response, "cached": cached, "conversation_id": conversation_id}
+
+    except SchedulerOverloaded as e:
+        raise overloaded_exception(e)
     except Exception as e:
         logger.error(f"Erreur lors du chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def overloaded_exception(error: SchedulerOverloaded) -> HTTPException:
+    logger.warning(f"Requête rejetée: {str(error)}")
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    ingestor: DocumentIngestor = Depends(get_ingestor),
+    llm_client: OllamaClient = Depends(get_ollama_client),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    scheduler: LLMScheduler = Depends(get_scheduler),
+    memory: ConversationMemory = Depends(get_conversation_memory)
+):
+    """Variante Server-Sent Events de /chat/ : les tokens sont relayés dès qu'Ollama les produit"""
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    # Rejet rapide tant qu'aucun octet n'a été envoyé : ensuite seul un événement d'erreur est possible
+    try:
+        scheduler.check_admission(llm_client.model)
+    except SchedulerOverloaded as e:
+        raise overloaded_exception(e)
+
+    async def event_stream():
+        started = time.perf_counter()
+        try:
+            turn = conversation_turn(request, memory, llm_client)
+            prompt, docs = await build_prompt(request, ingestor, turn.history, len(turn.context or []))
+            if prompt is None:
+                yield sse_event("token", {"token": NO_DOCUMENT_RESPONSE})
+                yield sse_event("done", {"conversation_id": conversation_id, "cached": False})
+                return
+
+            ttft_ms = None
+            last_chunk = {}
+            response, cache_key = await lookup_cached_response(
+                request, docs, ingestor, llm_client, response_cache, turn.has_history
+            )
+            cached = response is not None
+            if cached:
+                ttft_ms = (time.perf_counter() - started) * 1000
+                yield sse_event("ttft", {"ttft_ms": round(ttft_ms, 1)})
+                yield sse_event("token", {"token": response})
+            else:
+                parts = []
+                async for chunk in llm_client.stream_generate(prompt, generation_options(request), context=turn.context):
+                    token = chunk.get("response", "")
+                    if token:
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - started) * 1000
+                            logger.info(f"Premier token reçu en {ttft_ms:.0f} ms")
+                            yield sse_event("ttft", {"ttft_ms": round(ttft_ms, 1)})
+                        parts.append(token)
+                        yield sse_event("token", {"token": token})
+                    last_chunk = chunk
+                response = "".join(parts)
+                store_cached_response(response_cache, cache_key, response)
+
+            if ttft_ms is not None:
+                observe_stage("ttft", ttft_ms / 1000)
+
+            save_turn(conversation_id, request, response, memory, llm_client, last_chunk.get("context"))
+
+            yield sse_event("done", {
+                "conversation_id": conversation_id,
+                "cached": cached,
+                "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                "eval_count": last_chunk.get("eval_count"),
+                "prompt_eval_count": last_chunk.get("prompt_eval_count")
+            })
+        except SchedulerOverloaded as e:
+            logger.warning(f"Requête rejetée: {str(e)}")
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Erreur lors du chat en streaming: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/chat/scheduler")
+async def scheduler_stats(scheduler: LLMScheduler = Depends(get_scheduler)):
+    """État des files d'attente vers Ollama et temps d'attente par modèle"""
+    return scheduler.stats()
+
 @router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str):
+async def get_conversation(
+    conversation_id: str,
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
     try:
-        conversation_store = ConversationStore()
         conversation = conversation_store.load_conversation(conversation_id)
         return conversation
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Conversation not found: {str(e)}")
 
 @router.get("/conversations")
-async def list_conversations():
+async def list_conversations(
+    limit: int = Query(CONVERSATION_PAGE_SIZE, ge=1, le=500),
+    cursor: Optional[str] = None,
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
     try:
-        conversation_store = ConversationStore()
-        conversations = conversation_store.list_conversations()
-        return {"conversations": conversations}
+        return conversation_store.list_conversations_page(limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: str):
+async def delete_conversation(
+    conversation_id: str,
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
     try:
-        conversation_store = ConversationStore()
         conversation_store.delete_conversation(conversation_id)
         return {"message": f"Conversation {conversation_id} deleted successfully"}
     except Exception as e:
@@ -1,33 +1,68 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 from typing import List
 import os
 import shutil
 from src.rag.document_loader import DocumentLoader
+from src.rag.ingestion import DocumentIngestor
+from src.rag.jobs import IngestionJobQueue
+from src.api.dependencies import get_ingestor, get_job_queue
 
 router = APIRouter()
-document_loader = DocumentLoader()
 
 ALLOWED_EXTENSIONS = {'.pdf', '.txt', '.doc', '.docx'}
 
 @router.post("/upload")
-async def upload_documents(files: List[UploadFile] = File(...)):
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    ingestor: DocumentIngestor = Depends(get_ingestor),
+    job_queue: IngestionJobQueue = Depends(get_job_queue)
+):
     try:
         uploaded_files = []
         for file in files:
-            result = await document_loader.upload_document(file)
+            result = await ingestor.document_loader.upload_document(file)
+            # L'indexation se fait en arrière-plan : la réponse part sans l'attendre
+            job = job_queue.submit(result["name"], result["sha256"])
+            result["job_id"] = job.id
             uploaded_files.append(result)
         return {"uploaded": uploaded_files}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs")
+async def list_jobs(job_queue: IngestionJobQueue = Depends(get_job_queue)):
+    return {"jobs": [job.to_dict() for job in job_queue.list()]}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_queue: IngestionJobQueue = Depends(get_job_queue)):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} introuvable")
+    return job.to_dict()
+
 @router.get("/list")
-async def list_documents():
+async def list_documents(ingestor: DocumentIngestor = Depends(get_ingestor)):
     try:
-        documents = await document_loader.list_documents()
+        documents = await ingestor.document_loader.list_documents()
         return {"documents": documents}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/sync")
+async def sync_documents(ingestor: DocumentIngestor = Depends(get_ingestor)):
+    """Réindexe les documents ajoutés ou modifiés et retire de l'index ceux qui ont disparu"""
+    try:
+        return await ingestor.sync()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{filename}")
+async def delete_document(filename: str, ingestor: DocumentIngestor = Depends(get_ingestor)):
+    if not await ingestor.document_loader.delete_document(filename):
+        raise HTTPException(status_code=404, detail=f"Document {filename} introuvable")
+    deleted_chunks = await ingestor.remove_document(filename)
+    return {"status": "success", "deleted_chunks": deleted_chunks}
+
 @router.get("/test-connection")
 async def test_minio_connection():
     try:
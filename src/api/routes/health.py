@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from src.api.dependencies import get_warmup
+from src.warmup import Warmup
+
+router = APIRouter()
+
+@router.get("/health")
+async def health():
+    """Le processus répond (liveness)"""
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready(warmup: Warmup = Depends(get_warmup)):
+    """503 tant que le préchauffage n'est pas terminé, puis l'état de chaque étape"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -0,0 +1,342 @@
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from src.rag.index_generations import WriterLock
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_LOCK_NAME = "manifest.lock"
+# Tentatives d'écriture conditionnelle du manifeste MinIO avant d'abandonner
+MANIFEST_UPDATE_ATTEMPTS = 10
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Changement du manifeste : modifie le dict reçu et retourne (modifié, hash que plus rien ne désigne peut-être)
+ManifestChange = Callable[[Dict[str, Dict]], Tuple[bool, Optional[str]]]
+
+class BlobStore(ABC):
+    """Stockage adressé par contenu : un blob par sha256 et un manifeste nom -> hash.
+
+    Le manifeste est partagé par les workers et les CLI : chaque modification est une
+    lecture-modification-écriture atomique (_update_manifest), et le blob qu'un nom ne désigne
+    plus est supprimé dès qu'aucun autre nom n'y renvoie.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _read_manifest(self) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    def _update_manifest(self, change: ManifestChange) -> None:
+        """Applique change au manifeste sans perdre les écritures concurrentes, puis libère le blob rendu"""
+
+    @abstractmethod
+    def has_blob(self, sha256: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _store_blob(self, sha256: str, path: str) -> None:
+        ...
+
+    @abstractmethod
+    def _store_blob_bytes(self, sha256: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _delete_blob(self, sha256: str) -> None:
+        ...
+
+    @abstractmethod
+    def get_bytes(self, sha256: str) -> bytes:
+        ...
+
+    def manifest(self) -> Dict[str, Dict]:
+        return self._read_manifest()
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Hash du contenu publié sous ce nom"""
+        entry = self._read_manifest().get(name)
+        return entry["sha256"] if entry else None
+
+    def _release(self, sha256: Optional[str], manifest: Dict[str, Dict]) -> None:
+        """Supprime le blob s'il n'est plus désigné par aucun nom du manifeste"""
+        if sha256 and not any(entry["sha256"] == sha256 for entry in manifest.values()):
+            self._delete_blob(sha256)
+
+    def _record(self, name: str, sha256: str, size: int) -> None:
+        """Fait pointer le nom vers le hash ; l'ancien contenu du nom est supprimé s'il n'est plus référencé"""
+        def change(manifest: Dict[str, Dict]) -> Tuple[bool, Optional[str]]:
+            previous = manifest.get(name)
+            manifest[name] = {
+                "sha256": sha256,
+                "size": size,
+                "updated_at": datetime.now().isoformat()
+            }
+            return True, previous["sha256"] if previous and previous["sha256"] != sha256 else None
+
+        self._update_manifest(change)
+
+    def put_file(self, name: str, path: str, sha256: Optional[str] = None) -> Tuple[str, bool]:
+        """Publie un fichier sous un nom ; retourne (hash, True si le contenu existait déjà)"""
+        sha256 = sha256 or sha256_file(path)
+        duplicate = self.has_blob(sha256)
+        if not duplicate:
+            self._store_blob(sha256, path)
+        self._record(name, sha256, os.path.getsize(path))
+        if not self.has_blob(sha256):
+            # Blob supprimé entre-temps par un autre processus pour qui il n'était plus référencé
+            self._store_blob(sha256, path)
+        return sha256, duplicate
+
+    def put_bytes(self, name: str, data: bytes) -> Tuple[str, bool]:
+        sha256 = hashlib.sha256(data).hexdigest()
+        duplicate = self.has_blob(sha256)
+        if not duplicate:
+            self._store_blob_bytes(sha256, data)
+        self._record(name, sha256, len(data))
+        if not self.has_blob(sha256):
+            self._store_blob_bytes(sha256, data)
+        return sha256, duplicate
+
+    def remove(self, name: str) -> None:
+        """Retire un nom du manifeste et supprime le blob s'il n'est plus référencé"""
+        def change(manifest: Dict[str, Dict]) -> Tuple[bool, Optional[str]]:
+            entry = manifest.pop(name, None)
+            return entry is not None, entry["sha256"] if entry else None
+
+        self._update_manifest(change)
+
+class LocalBlobStore(BlobStore):
+    """Blobs sous <root>/blobs/ab/abcdef..., manifeste dans <root>/manifest.json"""
+
+    def __init__(self, root: str):
+        super().__init__()
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._manifest_path = os.path.join(root, MANIFEST_NAME)
+        # Verrou fichier partagé avec les autres processus (workers, CLI), comme write.lock de l'index
+        self._file_lock = WriterLock(os.path.join(root, MANIFEST_LOCK_NAME))
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def _read_manifest(self) -> Dict[str, Dict]:
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict[str, Dict]) -> None:
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _update_manifest(self, change: ManifestChange) -> None:
+        # Suppression du blob sous le verrou : personne ne peut le référencer entre la vérification et la suppression
+        with self._lock, self._file_lock:
+            manifest = self._read_manifest()
+            modified, released = change(manifest)
+            if modified:
+                self._write_manifest(manifest)
+                self._release(released, manifest)
+
+    def has_blob(self, sha256: str) -> bool:
+        return os.path.exists(self.blob_path(sha256))
+
+    def _store_blob(self, sha256: str, path: str) -> None:
+        os.makedirs(os.path.dirname(self.blob_path(sha256)), exist_ok=True)
+        shutil.copyfile(path, self.blob_path(sha256))
+
+    def _store_blob_bytes(self, sha256: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(self.blob_path(sha256)), exist_ok=True)
+        with open(self.blob_path(sha256), "wb") as f:
+            f.write(data)
+
+    def _delete_blob(self, sha256: str) -> None:
+        if os.path.exists(self.blob_path(sha256)):
+            os.remove(self.blob_path(sha256))
+
+    def get_bytes(self, sha256: str) -> bytes:
+        with open(self.blob_path(sha256), "rb") as f:
+            return f.read()
+
+    def commit_file(self, name: str, tmp_path: str, sha256: str) -> bool:
+        """Publie un fichier temporaire déjà haché ; le déplace ou le supprime si le contenu existe déjà"""
+        size = os.path.getsize(tmp_path)
+        duplicate = self.has_blob(sha256)
+        os.makedirs(os.path.dirname(self.blob_path(sha256)), exist_ok=True)
+        if not duplicate:
+            os.replace(tmp_path, self.blob_path(sha256))
+        self._record(name, sha256, size)
+        if duplicate:
+            # Le fichier temporaire n'est jeté qu'une fois le nom enregistré et le blob toujours présent
+            if self.has_blob(sha256):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, self.blob_path(sha256))
+        return duplicate
+
+class MinioBlobStore(BlobStore):
+    """Même organisation dans un bucket MinIO : objets blobs/<sha256> et manifest.json"""
+
+    def __init__(self, client, bucket_name: str, fetcher=None):
+        super().__init__()
+        self.client = client
+        self.bucket_name = bucket_name
+        # MinioFetcher : lectures parallèles et cache disque ; sans lui, GET simples
+        self.fetcher = fetcher
+
+    @staticmethod
+    def blob_name(sha256: str) -> str:
+        return f"blobs/{sha256}"
+
+    def _read_manifest_version(self) -> Tuple[Dict[str, Dict], Optional[str]]:
+        """(manifeste, ETag) ; ETag None si le manifeste n'existe pas encore"""
+        from minio.error import S3Error
+        try:
+            response = self.client.get_object(self.bucket_name, MANIFEST_NAME)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return {}, None
+            raise
+        try:
+            return json.loads(response.read().decode("utf-8")), response.headers.get("ETag")
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _read_manifest(self) -> Dict[str, Dict]:
+        return self._read_manifest_version()[0]
+
+    def _update_manifest(self, change: ManifestChange) -> None:
+        """Écriture conditionnelle (If-Match sur l'ETag lu) : si un autre processus a écrit entre-temps,
+        le manifeste est relu et le changement rejoué"""
+        from minio.error import S3Error
+        with self._lock:
+            for attempt in range(MANIFEST_UPDATE_ATTEMPTS):
+                manifest, etag = self._read_manifest_version()
+                modified, released = change(manifest)
+                if not modified:
+                    return
+                data = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+                headers = {"Content-Type": "application/json"}
+                if etag:
+                    headers["If-Match"] = etag
+                else:
+                    headers["If-None-Match"] = "*"
+                try:
+                    # put_object transforme les en-têtes inconnus en métadonnées : PutObject direct du SDK,
+                    # méthode privée dont la signature est vérifiée pour la version épinglée dans requirements.txt
+                    self.client._put_object(self.bucket_name, MANIFEST_NAME, data, headers)
+                except S3Error as e:
+                    if e.code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                        raise
+                    time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+                    continue
+                self._release(released, manifest)
+                return
+        raise RuntimeError(f"Manifeste {MANIFEST_NAME} modifié en concurrence, mise à jour abandonnée")
+
+    def has_blob(self, sha256: str) -> bool:
+        return self._object_exists(self.blob_name(sha256))
+
+    def _object_exists(self, object_name: str) -> bool:
+        from minio.error import S3Error
+        try:
+            self.client.stat_object(self.bucket_name, object_name)
+            return True
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return False
+            raise
+
+    def _store_blob(self, sha256: str, path: str) -> None:
+        self.client.fput_object(self.bucket_name, self.blob_name(sha256), path)
+
+    def _store_blob_bytes(self, sha256: str, data: bytes) -> None:
+        self.client.put_object(self.bucket_name, self.blob_name(sha256), io.BytesIO(data), len(data))
+
+    def _delete_blob(self, sha256: str) -> None:
+        self.client.remove_object(self.bucket_name, self.blob_name(sha256))
+
+    def get_bytes(self, sha256: str) -> bytes:
+        if self.fetcher is not None:
+            return self.fetcher.read_bytes(self.blob_name(sha256))
+        response = self.client.get_object(self.bucket_name, self.blob_name(sha256))
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, bytes]:
+        """Lit plusieurs blobs, en parallèle si un fetcher est configuré"""
+        hashes = list(dict.fromkeys(hashes))
+        contents = self.read_objects(self.blob_name(sha256) for sha256 in hashes)
+        return {
+            sha256: contents[self.blob_name(sha256)]
+            for sha256 in hashes if self.blob_name(sha256) in contents
+        }
+
+    def download(self, sha256: str, file_path: str) -> None:
+        self.download_object(self.blob_name(sha256), file_path)
+
+    def legacy_names(self, manifest: Optional[Dict[str, Dict]] = None) -> List[str]:
+        """Objets déposés sous leur nom avant le stockage par contenu, absents du manifeste.
+
+        Ils restent lisibles tels quels, comme les fichiers déposés directement dans documents/ en local.
+        """
+        manifest = self._read_manifest() if manifest is None else manifest
+        # Listing non récursif : blobs/ n'apparaît que comme préfixe
+        return [
+            obj.object_name for obj in self.client.list_objects(self.bucket_name)
+            if not obj.is_dir and obj.object_name != MANIFEST_NAME and obj.object_name not in manifest
+        ]
+
+    def is_legacy(self, name: str) -> bool:
+        """True si un objet hérité est stocké sous ce nom"""
+        if name == MANIFEST_NAME or name.startswith(self.blob_name("")):
+            return False
+        return self._object_exists(name)
+
+    def read_objects(self, object_names: Iterable[str]) -> Dict[str, bytes]:
+        """Lit des objets par leur nom, en parallèle si un fetcher est configuré"""
+        object_names = list(dict.fromkeys(object_names))
+        if self.fetcher is not None:
+            return self.fetcher.read_many(object_names)
+        contents = {}
+        for object_name in object_names:
+            response = self.client.get_object(self.bucket_name, object_name)
+            try:
+                contents[object_name] = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        return contents
+
+    def download_object(self, object_name: str, file_path: str) -> None:
+        if self.fetcher is not None:
+            self.fetcher.fetch(object_name, file_path)
+            return
+        self.client.fget_object(self.bucket_name, object_name, file_path)
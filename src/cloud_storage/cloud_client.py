@@ -8,10 +8,12 @@ import io
 # Ajout du chemin src au PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src.config import MINIO_CONFIG
+from src.cloud_storage.blob_store import MinioBlobStore
+from src.cloud_storage.object_fetcher import MinioFetcher, ObjectCache
 
 class CloudStorageClient:
-    def __init__(self):
-        self.client = Minio(
+    def __init__(self, client: Optional[Minio] = None, cache: Optional[ObjectCache] = None):
+        self.client = client or Minio(
             endpoint=MINIO_CONFIG["endpoint"],
             access_key=MINIO_CONFIG["access_key"],
             secret_key=MINIO_CONFIG["secret_key"],
@@ -19,6 +21,9 @@ class CloudStorageClient:
         )
         self.bucket_name = MINIO_CONFIG["bucket_name"]
         self._ensure_bucket_exists()
+        # Objets stockés sous blobs/<sha256>, le nom d'objet n'est qu'une entrée du manifeste
+        self.fetcher = MinioFetcher(self.client, self.bucket_name, cache=cache or ObjectCache())
+        self.blob_store = MinioBlobStore(self.client, self.bucket_name, fetcher=self.fetcher)
 
     def _ensure_bucket_exists(self):
         """Vérifie si le bucket existe, le crée si nécessaire."""
@@ -34,26 +39,29 @@ class CloudStorageClient:
             object_name = file_path.split("/")[-1]
         
         try:
-            self.client.fput_object(
-                self.bucket_name, object_name, file_path
-            )
+            self.blob_store.put_file(object_name, file_path)
             return object_name
         except S3Error as e:
             raise Exception(f"Erreur lors de l'upload: {str(e)}")
 
     def download_file(self, object_name: str, file_path: str) -> None:
-        """Télécharge un fichier du stockage cloud."""
+        """Télécharge un fichier du stockage cloud (via le cache local si l'ETag n'a pas changé)."""
         try:
-            self.client.fget_object(
-                self.bucket_name, object_name, file_path
-            )
+            sha256 = self.blob_store.resolve(object_name)
+            if sha256 is not None:
+                self.blob_store.download(sha256, file_path)
+            elif self.blob_store.is_legacy(object_name):
+                # Objet déposé sous son nom avant le stockage par contenu
+                self.blob_store.download_object(object_name, file_path)
+            else:
+                raise Exception(f"Fichier introuvable: {object_name}")
         except S3Error as e:
             raise Exception(f"Erreur lors du téléchargement: {str(e)}")
 
     def list_files(self) -> List[str]:
         """Liste tous les fichiers dans le bucket."""
         try:
-            objects = self.client.list_objects(self.bucket_name)
-            return [obj.object_name for obj in objects]
+            manifest = self.blob_store.manifest()
+            return list(manifest) + self.blob_store.legacy_names(manifest)
         except S3Error as e:
             raise Exception(f"Erreur lors de la liste des fichiers: {str(e)}")
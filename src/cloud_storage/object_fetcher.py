@@ -0,0 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+from src.config import MINIO_FETCH_CONFIG
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ObjectCache:
+    """Cache disque des objets téléchargés, validé par ETag et évincé en LRU par taille totale"""
+
+    def __init__(self, path: str = MINIO_FETCH_CONFIG["cache_path"], max_bytes: int = MINIO_FETCH_CONFIG["cache_max_bytes"]):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(path, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "key TEXT PRIMARY KEY, etag TEXT NOT NULL, size_bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_objects_access ON objects(last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(bucket_name: str, object_name: str) -> str:
+        return hashlib.sha256(f"{bucket_name}\0{object_name}".encode('utf-8')).hexdigest()
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.objects_dir, key)
+
+    def get(self, key: str, etag: str) -> Optional[str]:
+        """Chemin local de l'objet si la copie en cache correspond à l'ETag courant"""
+        with self._lock:
+            row = self._conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] != etag or not os.path.exists(self._file_path(key)):
+                # L'objet a changé côté serveur : la copie locale est périmée
+                self._delete(key)
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE objects SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return self._file_path(key)
+
+    def put(self, key: str, etag: str, tmp_path: str) -> str:
+        """Déplace un fichier téléchargé dans le cache et retourne son chemin"""
+        size_bytes = os.path.getsize(tmp_path)
+        with self._lock:
+            os.replace(tmp_path, self._file_path(key))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (key, etag, size_bytes, last_access) VALUES (?, ?, ?, ?)",
+                (key, etag, size_bytes, time.time())
+            )
+            self._evict(keep=key)
+            self._conn.commit()
+        return self._file_path(key)
+
+    def temp_path(self) -> str:
+        return os.path.join(self.objects_dir, f"{uuid.uuid4()}.part")
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+        if os.path.exists(self._file_path(key)):
+            os.remove(self._file_path(key))
+
+    def _evict(self, keep: str) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM objects"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size_bytes FROM objects ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = 0
+        for key, size_bytes in rows:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self._delete(key)
+            total -= size_bytes
+            evicted += 1
+        logger.info(f"Cache d'objets: {evicted} entrées évincées")
+
+class MinioFetcher:
+    """Téléchargements MinIO en parallèle, par plages pour les gros objets, à travers un ObjectCache"""
+
+    def __init__(
+        self,
+        client,
+        bucket_name: str,
+        cache: Optional[ObjectCache] = None,
+        max_workers: int = MINIO_FETCH_CONFIG["max_workers"],
+        part_size: int = MINIO_FETCH_CONFIG["part_size"],
+        multipart_threshold: int = MINIO_FETCH_CONFIG["multipart_threshold"]
+    ):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.cache = cache
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        # Deux pools distincts : un objet en cours peut attendre ses plages sans bloquer les autres
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="minio-fetch")
+        self._part_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="minio-part")
+
+    def _download_range(self, object_name: str, etag: str, file_path: str, offset: int, length: int) -> None:
+        # If-Match : toutes les plages proviennent de la même version de l'objet
+        response = self.client.get_object(
+            self.bucket_name, object_name, offset=offset, length=length,
+            request_headers={"If-Match": etag}
+        )
+        try:
+            with open(file_path, "r+b") as f:
+                f.seek(offset)
+                for data in response.stream(1024 * 1024):
+                    f.write(data)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def _download(self, object_name: str, etag: str, size: int, file_path: str) -> None:
+        if size <= self.multipart_threshold:
+            self.client.fget_object(self.bucket_name, object_name, file_path)
+            return
+        with open(file_path, "wb") as f:
+            f.truncate(size)
+        futures = [
+            self._part_executor.submit(
+                self._download_range, object_name, etag, file_path, offset, min(self.part_size, size - offset)
+            )
+            for offset in range(0, size, self.part_size)
+        ]
+        for future in futures:
+            future.result()
+
+    def fetch(self, object_name: str, file_path: Optional[str] = None) -> str:
+        """Télécharge un objet (ou le lit depuis le cache) et retourne son chemin local"""
+        stat = self.client.stat_object(self.bucket_name, object_name)
+        etag = stat.etag
+
+        if self.cache is None:
+            if file_path is None:
+                raise ValueError("file_path requis sans cache d'objets")
+            self._download(object_name, etag, stat.size, file_path)
+            return file_path
+
+        key = ObjectCache.make_key(self.bucket_name, object_name)
+        cached_path = self.cache.get(key, etag)
+        if cached_path is None:
+            tmp_path = self.cache.temp_path()
+            try:
+                self._download(object_name, etag, stat.size, tmp_path)
+                cached_path = self.cache.put(key, etag, tmp_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        if file_path is None:
+            return cached_path
+        shutil.copyfile(cached_path, file_path)
+        return file_path
+
+    def read_bytes(self, object_name: str) -> bytes:
+        if self.cache is None:
+            response = self.client.get_object(self.bucket_name, object_name)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+        try:
+            with open(self.fetch(object_name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            # Évincé entre le téléchargement et la lecture par un téléchargement concurrent
+            with open(self.fetch(object_name), "rb") as f:
+                return f.read()
+
+    def read_many(self, object_names: Iterable[str]) -> Dict[str, bytes]:
+        """Lit plusieurs objets en parallèle ; les objets en erreur sont absents du résultat"""
+        object_names = list(dict.fromkeys(object_names))
+        futures = {name: self._executor.submit(self.read_bytes, name) for name in object_names}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Error reading {name}: {str(e)}")
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self._part_executor.shutdown(wait=False)
@@ -17,18 +17,117 @@ MINIO_CONFIG = {
     "secure": False  # Mettre à True pour HTTPS
 }
 
+# Téléchargements MinIO : parallélisme, GET par plages et cache disque
+MINIO_FETCH_CONFIG = {
+    "max_workers": int(os.getenv("MINIO_FETCH_WORKERS", "8")),
+    "part_size": int(os.getenv("MINIO_PART_SIZE", str(8 * 1024 * 1024))),
+    "multipart_threshold": int(os.getenv("MINIO_MULTIPART_THRESHOLD", str(32 * 1024 * 1024))),
+    "cache_path": os.getenv("OBJECT_CACHE_PATH", "./data/object_cache"),
+    "cache_max_bytes": int(os.getenv("OBJECT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+}
+
 # Configuration Ollama
 OLLAMA_CONFIG = {
     "base_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-    "model_name": os.getenv("MODEL_NAME", "mistral")
+    "model_name": os.getenv("MODEL_NAME", "mistral"),
+    "embedding_model": os.getenv("EMBEDDING_MODEL_NAME", os.getenv("MODEL_NAME", "mistral")),
+    "connect_timeout": float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5")),
+    "read_timeout": float(os.getenv("OLLAMA_READ_TIMEOUT", "300")),
+    "max_retries": int(os.getenv("OLLAMA_MAX_RETRIES", "2")),
+    "max_connections": int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16")),
+    # Durée pendant laquelle Ollama garde les modèles en mémoire après un appel ("30m", "-1" = toujours)
+    "keep_alive": os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+}
+
+# Préchauffage au démarrage : modèle chargé dans Ollama, embedding factice, index parcouru.
+# /ready répond 503 tant qu'il n'est pas terminé
+WARMUP_CONFIG = {
+    "enabled": os.getenv("WARMUP_ENABLED", "true").lower() == "true",
+    "timeout": float(os.getenv("WARMUP_TIMEOUT", "300"))
+}
+
+# Ordonnancement des requêtes vers Ollama
+SCHEDULER_CONFIG = {
+    "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "2")),  # par modèle
+    "max_queue": int(os.getenv("LLM_MAX_QUEUE", "32")),
+    "queue_timeout": float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
 }
 
 # Configuration Vector Store
 VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./data/vector_store")
+# Type d'index FAISS (spec faiss.index_factory : Flat, HNSW32, IVF1024,Flat, IVF1024,PQ16, SQ8...)
+VECTOR_INDEX_CONFIG = {
+    "spec": os.getenv("VECTOR_INDEX_SPEC", "Flat"),
+    "nprobe": int(os.getenv("VECTOR_INDEX_NPROBE", "16")),  # IVF : listes visitées par requête
+    "ef_search": int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64")),  # HNSW : largeur de recherche
+    "train_size": int(os.getenv("VECTOR_INDEX_TRAIN_SIZE", "100000"))  # échantillon d'entraînement max
+}
+# Part de vecteurs supprimés (tombstones) au-delà de laquelle l'index est compacté
+VECTOR_STORE_COMPACTION_RATIO = float(os.getenv("VECTOR_STORE_COMPACTION_RATIO", "0.2"))
+# Générations publiées conservées sur disque, et intervalle (s) entre deux vérifications de CURRENT
+VECTOR_STORE_GENERATIONS_KEEP = int(os.getenv("VECTOR_STORE_GENERATIONS_KEEP", "3"))
+VECTOR_STORE_REFRESH_INTERVAL = float(os.getenv("VECTOR_STORE_REFRESH_INTERVAL", "1.0"))
+
+# Cache des embeddings
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./data/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Cache du texte extrait des PDF
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "./data/extraction_cache.sqlite")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Extraction parallèle des PDF
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "30"))
+
+# Upload et ingestion en arrière-plan
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "1"))
+INGESTION_JOB_HISTORY = int(os.getenv("INGESTION_JOB_HISTORY", "1000"))
+# Fichiers extraits et analysés ensemble lors d'un sync (analyse répartie en un lot sur le pool)
+INGESTION_BATCH_FILES = int(os.getenv("INGESTION_BATCH_FILES", "16"))
+
+# Calcul des embeddings par lots
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
 
 # Configuration RAG
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+# Construction du contexte sous budget de tokens
+CONTEXT_PACKING_CONFIG = {
+    "context_window": int(os.getenv("LLM_CONTEXT_WINDOW", "4096")),
+    "history_tokens": int(os.getenv("HISTORY_TOKEN_BUDGET", "512")),
+    "strategy": os.getenv("CONTEXT_PACKING_STRATEGY", "greedy"),  # greedy ou mmr
+    "mmr_lambda": float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+}
+
+# Cache sémantique des réponses
+RESPONSE_CACHE_CONFIG = {
+    "similarity_threshold": float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+    "ttl": float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    "max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+}
+
+# Conversations
+CONVERSATION_PAGE_SIZE = int(os.getenv("CONVERSATION_PAGE_SIZE", "50"))
+# Mémoire des conversations : au-delà de history_tokens, les échanges anciens sont intégrés à un résumé
+CONVERSATION_MEMORY_CONFIG = {
+    "summary_tokens": int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "192")),  # longueur max du résumé
+    # Après un résumé, les échanges conservés in extenso occupent au plus cette part du budget
+    "fold_ratio": float(os.getenv("CONVERSATION_FOLD_RATIO", "0.5"))
+}
+# Contexte KV renvoyé par Ollama (`context`), réutilisé au tour suivant pour ne pas recalculer l'historique
+KV_CONTEXT_CONFIG = {
+    "enabled": os.getenv("KV_CONTEXT_ENABLED", "true").lower() == "true",
+    # Au-delà, on repart d'un contexte neuf avec le résumé glissant et les derniers échanges
+    "max_tokens": int(os.getenv("KV_CONTEXT_MAX_TOKENS", str(CONTEXT_PACKING_CONFIG["context_window"] // 2))),
+    # Taille totale des contextes conservés, les moins récemment utilisés sont évincés
+    "cache_max_bytes": int(os.getenv("KV_CONTEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+}
 
 # Paramètres LLM par défaut
 DEFAULT_LLM_PARAMS = {
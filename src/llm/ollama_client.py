@@ -1,40 +1,224 @@
-import requests
+import httpx
+import asyncio
+import json
+import time
 import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from src.config import OLLAMA_CONFIG
+from src.llm.scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from src.metrics import TOKENS_PER_SECOND, observe_stage
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_ollama_response(query: str, context: str = "") -> str:
-    try:
-        logger.info("Envoi de la requête à Ollama")
-        
-        # Construire le prompt avec le contexte
-        prompt = f"""Contexte: {context}
-
-Question: {query}
-
-Réponse:"""
-
-        # Appel à l'API Ollama
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                'model': 'mistral',
-                'prompt': prompt,
-                'stream': False
-            }
+class OllamaClient:
+    """Client Ollama partagé : connexions keep-alive, timeouts et reprises bornées"""
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_CONFIG["base_url"],
+        model: str = OLLAMA_CONFIG["model_name"],
+        embedding_model: str = OLLAMA_CONFIG["embedding_model"],
+        connect_timeout: float = OLLAMA_CONFIG["connect_timeout"],
+        read_timeout: float = OLLAMA_CONFIG["read_timeout"],
+        max_retries: int = OLLAMA_CONFIG["max_retries"],
+        max_connections: int = OLLAMA_CONFIG["max_connections"],
+        keep_alive: Optional[str] = OLLAMA_CONFIG["keep_alive"],
+        scheduler: Optional[LLMScheduler] = None
+    ):
+        self.base_url = base_url
+        self.scheduler = scheduler
+        self.model = model
+        self.embedding_model = embedding_model
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive or None
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
         )
-        
-        logger.info("Réponse reçue d'Ollama")
-        response_json = response.json()
-        
-        if 'response' in response_json:
-            return response_json['response']
-        else:
-            logger.error(f"Réponse Ollama invalide: {response_json}")
-            return "Désolé, je n'ai pas pu générer une réponse cohérente."
-
-    except Exception as e:
-        logger.error(f"Erreur lors de l'appel à Ollama: {str(e)}", exc_info=True)
-        raise Exception(f"Erreur lors de l'appel à Ollama: {str(e)}")
+        self._client = httpx.AsyncClient(base_url=base_url, timeout=self.timeout, limits=self.limits)
+        # Client synchrone créé à la demande pour les usages hors boucle d'événements (scripts)
+        self._sync_client: Optional[httpx.Client] = None
+        # Boucle du scheduler : les appels synchrones faits depuis un thread y sont renvoyés
+        try:
+            self._loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+
+    @asynccontextmanager
+    async def _slot(self, model: str, priority: int):
+        """Passe par le scheduler quand il y en a un (admission, file d'attente, concurrence bornée)"""
+        if self.scheduler is None:
+            yield
+            return
+        async with self.scheduler.slot(model, priority):
+            yield
+
+    def _through_loop(self) -> bool:
+        """Vrai si un appel synchrone doit passer par la boucle du scheduler (appel depuis un autre thread).
+
+        Sans scheduler, sans boucle active (scripts) ou depuis la boucle elle-même, où attendre la boucle
+        la bloquerait, l'appel part directement sur le client synchrone, hors limite de concurrence.
+        """
+        if self.scheduler is None or self._loop is None or not self._loop.is_running():
+            return False
+        try:
+            return asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            return True
+
+    def _run_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _retry_delay(self, attempt: int) -> float:
+        return 0.5 * (2 ** attempt)
+
+    @staticmethod
+    def _should_retry(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    async def _post(self, path: str, payload: Dict) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.post(path, json=payload)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if attempt == self.max_retries or not self._should_retry(e):
+                    raise
+                logger.warning(f"Appel Ollama {path} échoué ({str(e)}), nouvel essai")
+                await asyncio.sleep(self._retry_delay(attempt))
+
+    def _post_sync(self, path: str, payload: Dict) -> Dict:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._sync_client.post(path, json=payload)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                if attempt == self.max_retries or not self._should_retry(e):
+                    raise
+                logger.warning(f"Appel Ollama {path} échoué ({str(e)}), nouvel essai")
+                time.sleep(self._retry_delay(attempt))
+
+    def _record_generation(self, result: Dict, elapsed: float) -> None:
+        """Durée de génération et débit en tokens/s (eval_duration d'Ollama, sinon durée mesurée)"""
+        observe_stage("generation", elapsed)
+        eval_count = result.get('eval_count')
+        if not eval_count:
+            return
+        eval_seconds = result['eval_duration'] / 1e9 if result.get('eval_duration') else elapsed
+        if eval_seconds > 0:
+            TOKENS_PER_SECOND.observe(eval_count / eval_seconds, model=self.model)
+
+    def _generate_payload(self, prompt: str, options: Optional[Dict], stream: bool, context: Optional[List[int]] = None) -> Dict:
+        payload = {'model': self.model, 'prompt': prompt, 'stream': stream}
+        if options:
+            payload['options'] = options
+        if context:
+            # Tokens déjà évalués au tour précédent : Ollama ne recalcule que le nouveau prompt
+            payload['context'] = context
+        if self.keep_alive:
+            payload['keep_alive'] = self.keep_alive
+        return payload
+
+    def _embed_payload(self, texts: List[str]) -> Dict:
+        payload = {'model': self.embedding_model, 'input': texts}
+        if self.keep_alive:
+            payload['keep_alive'] = self.keep_alive
+        return payload
+
+    async def preload(self) -> None:
+        """Charge le modèle de génération dans Ollama sans rien générer (requête sans prompt)"""
+        payload = {'model': self.model}
+        if self.keep_alive:
+            payload['keep_alive'] = self.keep_alive
+        await self._post('/api/generate', payload)
+
+    async def generate(
+        self,
+        prompt: str,
+        options: Optional[Dict] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        context: Optional[List[int]] = None
+    ) -> Dict:
+        """Appelle /api/generate sans streaming et retourne la réponse JSON complète (dont `context`)"""
+        async with self._slot(self.model, priority):
+            started = time.perf_counter()
+            result = await self._post('/api/generate', self._generate_payload(prompt, options, False, context))
+            self._record_generation(result, time.perf_counter() - started)
+            return result
+
+    def generate_sync(
+        self,
+        prompt: str,
+        options: Optional[Dict] = None,
+        context: Optional[List[int]] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict:
+        """Variante bloquante de generate, soumise au scheduler lorsqu'elle est appelée depuis un thread"""
+        if self._through_loop():
+            return self._run_in_loop(self.generate(prompt, options, priority, context))
+        return self._post_sync('/api/generate', self._generate_payload(prompt, options, False, context))
+
+    async def stream_generate(
+        self,
+        prompt: str,
+        options: Optional[Dict] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        context: Optional[List[int]] = None
+    ) -> AsyncIterator[Dict]:
+        """Relaie les fragments de /api/generate en mode stream, un dict JSON par fragment"""
+        async with self._slot(self.model, priority):
+            started = time.perf_counter()
+            async for chunk in self._stream_generate(self._generate_payload(prompt, options, True, context)):
+                if chunk.get('done'):
+                    self._record_generation(chunk, time.perf_counter() - started)
+                yield chunk
+
+    async def _stream_generate(self, payload: Dict) -> AsyncIterator[Dict]:
+        relayed = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._client.stream('POST', '/api/generate', json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if 'error' in chunk:
+                            raise Exception(f"Erreur Ollama: {chunk['error']}")
+                        relayed = True
+                        yield chunk
+                return
+            except Exception as e:
+                # Une reprise n'est possible que si aucun fragment n'a encore été relayé
+                if relayed or attempt == self.max_retries or not self._should_retry(e):
+                    raise
+                logger.warning(f"Connexion Ollama échouée ({str(e)}), nouvel essai")
+                await asyncio.sleep(self._retry_delay(attempt))
+
+    async def embed(self, texts: List[str], priority: int = PRIORITY_BATCH) -> List[List[float]]:
+        """Calcule les embeddings d'une liste de textes via /api/embed"""
+        async with self._slot(self.embedding_model, priority):
+            response = await self._post('/api/embed', self._embed_payload(texts))
+        return response['embeddings']
+
+    def embed_sync(self, texts: List[str], priority: int = PRIORITY_BATCH) -> List[List[float]]:
+        """Variante bloquante de embed, soumise au scheduler lorsqu'elle est appelée depuis un thread"""
+        if self._through_loop():
+            return self._run_in_loop(self.embed(texts, priority))
+        response = self._post_sync('/api/embed', self._embed_payload(texts))
+        return response['embeddings']
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
@@ -0,0 +1,166 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+from src.config import SCHEDULER_CONFIG
+from src.metrics import observe_stage
+import asyncio
+import heapq
+import itertools
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Plus la valeur est basse, plus la requête est servie tôt
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+class SchedulerOverloaded(Exception):
+    """File d'attente pleine ou délai d'attente dépassé"""
+
+    def __init__(self, message: str, retry_after: int, queue_full: bool):
+        super().__init__(message)
+        self.retry_after = retry_after
+        # True : rejet immédiat (429), False : attente trop longue (503)
+        self.queue_full = queue_full
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.queue_full else 503
+
+class _ModelQueue:
+    def __init__(self):
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.queue_times: Deque[float] = deque(maxlen=1000)
+        self.service_time = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def pending(self, max_priority: Optional[int] = None) -> int:
+        """Nombre d'attentes en cours, limité aux priorités <= max_priority si précisé"""
+        return sum(
+            1 for priority, _, future in self.waiters
+            if not future.done() and (max_priority is None or priority <= max_priority)
+        )
+
+class LLMScheduler:
+    """Limite la concurrence par modèle devant Ollama, avec une file bornée et priorisée"""
+
+    def __init__(
+        self,
+        max_concurrency: int = SCHEDULER_CONFIG["max_concurrency"],
+        max_queue: int = SCHEDULER_CONFIG["max_queue"],
+        queue_timeout: float = SCHEDULER_CONFIG["queue_timeout"]
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._sequence = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        if model not in self._queues:
+            self._queues[model] = _ModelQueue()
+        return self._queues[model]
+
+    def _retry_after(self, queue: _ModelQueue) -> int:
+        """Estimation du temps avant qu'une place se libère, en secondes"""
+        service_time = queue.service_time or 1.0
+        # Les lots passent après les requêtes interactives : seules celles-ci sont devant
+        ahead = queue.pending(PRIORITY_INTERACTIVE)
+        return max(1, math.ceil(service_time * (ahead + 1) / self.max_concurrency))
+
+    def check_admission(self, model: str) -> None:
+        """Lève SchedulerOverloaded si une nouvelle requête interactive serait rejetée"""
+        queue = self._queue(model)
+        if queue.active >= self.max_concurrency and queue.pending(PRIORITY_INTERACTIVE) >= self.max_queue:
+            queue.rejected += 1
+            raise SchedulerOverloaded(
+                f"File d'attente pleine pour {model}", self._retry_after(queue), queue_full=True
+            )
+
+    def _release(self, model: str) -> None:
+        queue = self._queue(model)
+        while queue.waiters:
+            _, _, future = heapq.heappop(queue.waiters)
+            if not future.done():
+                # La place est transmise directement au prochain en attente
+                future.set_result(None)
+                return
+        queue.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_INTERACTIVE):
+        """Attend une place pour le modèle.
+
+        Seules les requêtes interactives sont soumises à l'admission et à queue_timeout : un lot
+        (embeddings d'ingestion, résumés) attend son tour aussi longtemps que la charge de chat l'impose.
+        """
+        queue = self._queue(model)
+        enqueued = time.perf_counter()
+        interactive = priority <= PRIORITY_INTERACTIVE
+
+        if queue.active < self.max_concurrency and not queue.pending():
+            queue.active += 1
+        else:
+            if interactive:
+                self.check_admission(model)
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(queue.waiters, (priority, next(self._sequence), future))
+            try:
+                await asyncio.wait_for(future, timeout=self.queue_timeout if interactive else None)
+            except asyncio.TimeoutError:
+                # Même course que pour l'annulation : une place transmise au moment du délai est rendue
+                if future.done() and not future.cancelled():
+                    self._release(model)
+                queue.timed_out += 1
+                raise SchedulerOverloaded(
+                    f"Délai d'attente dépassé pour {model}", self._retry_after(queue), queue_full=False
+                )
+            except asyncio.CancelledError:
+                # La place a pu être transmise juste avant l'annulation : il faut la rendre
+                if future.done() and not future.cancelled():
+                    self._release(model)
+                raise
+
+        queue_time = time.perf_counter() - enqueued
+        queue.queue_times.append(queue_time)
+        observe_stage("llm_queue", queue_time)
+        queue.admitted += 1
+        if queue_time > 1:
+            logger.info(f"Requête {model} admise après {queue_time:.2f}s d'attente")
+
+        started = time.perf_counter()
+        try:
+            yield queue_time
+        finally:
+            # Moyenne mobile du temps de service, utilisée pour Retry-After
+            elapsed = time.perf_counter() - started
+            queue.service_time = elapsed if not queue.service_time else 0.8 * queue.service_time + 0.2 * elapsed
+            self._release(model)
+
+    def stats(self) -> Dict[str, Dict]:
+        """État des files et percentiles du temps d'attente, par modèle"""
+        result = {}
+        for model, queue in self._queues.items():
+            times = sorted(queue.queue_times)
+
+            def percentile(p: float) -> Optional[float]:
+                if not times:
+                    return None
+                return round(times[min(len(times) - 1, int(p * len(times)))] * 1000, 1)
+
+            result[model] = {
+                "active": queue.active,
+                "queued": queue.pending(),
+                "admitted": queue.admitted,
+                "rejected": queue.rejected,
+                "timed_out": queue.timed_out,
+                "queue_time_p50_ms": percentile(0.5),
+                "queue_time_p95_ms": percentile(0.95),
+                "queue_time_p99_ms": percentile(0.99)
+            }
+        return result
@@ -0,0 +1,34 @@
+from contextvars import ContextVar
+import logging
+import uuid
+
+# Identifiant de la requête HTTP en cours, propagé aux tâches asyncio et à asyncio.to_thread
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+_installed = False
+
+def install_request_id_logging() -> None:
+    """Ajoute request_id à chaque LogRecord et l'affiche dans le format des handlers racine"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    previous_factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs) -> logging.LogRecord:
+        record = previous_factory(*args, **kwargs)
+        record.request_id = request_id_var.get()
+        return record
+
+    logging.setLogRecordFactory(record_factory)
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(level=logging.INFO)
+    for handler in root.handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
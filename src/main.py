@@ -1,8 +1,62 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from src.api.routes import chat, documents
+from src.api.routes import chat, documents, health, metrics
+from src.logging_context import install_request_id_logging, new_request_id, request_id_var
+from src.metrics import HTTP_REQUEST_DURATION
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import LLMScheduler
+from src.rag.conversation_memory import ConversationMemory
+from src.rag.conversation_store import ConversationStore
+from src.rag.embeddings import EmbeddingManager
+from src.rag.ingestion import DocumentIngestor
+from src.rag.jobs import IngestionJobQueue
+from src.rag.response_cache import ResponseCache
+from src.rag.vector_store import VectorStore
+from src.warmup import Warmup
+import asyncio
+import time
 
-app = FastAPI()
+install_request_id_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Objets partagés par toutes les requêtes ; l'index persisté est chargé hors de la boucle d'événements
+    scheduler = LLMScheduler()
+    ollama_client = OllamaClient(scheduler=scheduler)
+    embedding_manager = EmbeddingManager(ollama_client)
+    vector_store = await asyncio.to_thread(VectorStore, embedding_manager.get_embeddings())
+    response_cache = ResponseCache()
+    # Index publié par un autre worker : les réponses en cache ont pu être construites sur l'ancien
+    vector_store.on_generation_change(response_cache.clear)
+    ingestor = await asyncio.to_thread(DocumentIngestor, vector_store, response_cache=response_cache)
+    job_queue = IngestionJobQueue(ingestor)
+    # Un seul store (et ses connexions SQLite) pour la mémoire et les routes /conversations
+    conversation_store = ConversationStore()
+    conversation_memory = ConversationMemory(ollama_client, store=conversation_store)
+    warmup = Warmup(ollama_client, vector_store)
+
+    app.state.scheduler = scheduler
+    app.state.ollama_client = ollama_client
+    app.state.vector_store = vector_store
+    app.state.response_cache = response_cache
+    app.state.ingestor = ingestor
+    app.state.job_queue = job_queue
+    app.state.conversation_store = conversation_store
+    app.state.conversation_memory = conversation_memory
+    app.state.warmup = warmup
+
+    await job_queue.start()
+    # Le serveur accepte les connexions pendant le préchauffage ; /ready indique quand il est fini
+    warmup.start()
+    yield
+    await warmup.stop()
+    await conversation_memory.stop()
+    conversation_store.close()
+    await job_queue.stop()
+    await ollama_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configuration CORS
 app.add_middleware(
@@ -13,9 +67,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Identifiant de requête dans tous les logs (repris de X-Request-ID s'il est fourni) et durée par route"""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=str(status)
+        )
+        request_id_var.reset(token)
+
 # Inclure les routes
 app.include_router(chat.router, prefix="/api")
 app.include_router(documents.router, prefix="/api/documents")
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,125 @@
+from typing import Dict, List, Optional
+from src.config import VECTOR_INDEX_CONFIG
+import re
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Les specs sont des chaînes faiss.index_factory : "Flat", "HNSW32", "IVF1024,Flat", "IVF1024,PQ16", "SQ8"...
+FLAT_SPEC = "Flat"
+
+def faiss_module():
+    """Import différé de faiss : ni faiss ni langchain_community ne sont chargés à l'import de l'API"""
+    from langchain_community.vectorstores.faiss import dependable_faiss_import
+    return dependable_faiss_import()
+
+def min_training_vectors(spec: str) -> int:
+    """Nombre de vecteurs en dessous duquel l'entraînement de l'index n'a pas de sens"""
+    minimum = 1
+    ivf = re.search(r"IVF(\d+)", spec)
+    if ivf:
+        # FAISS recommande au moins 39 points par centroïde
+        minimum = max(minimum, 39 * int(ivf.group(1)))
+    if re.search(r"PQ\d+", spec):
+        minimum = max(minimum, 39 * 256)
+    if "SQ" in spec:
+        minimum = max(minimum, 1000)
+    return minimum
+
+def needs_training(spec: str, dimension: int) -> bool:
+    faiss = faiss_module()
+    return not faiss.index_factory(dimension, spec).is_trained
+
+def apply_search_params(
+    index,
+    nprobe: int = VECTOR_INDEX_CONFIG["nprobe"],
+    ef_search: int = VECTOR_INDEX_CONFIG["ef_search"]
+) -> None:
+    """Règle nprobe (IVF) et efSearch (HNSW) quand l'index les utilise"""
+    faiss = faiss_module()
+    space = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            # Paramètre sans objet pour ce type d'index
+            continue
+
+def build_index(
+    spec: str,
+    vectors: np.ndarray,
+    train_size: int = VECTOR_INDEX_CONFIG["train_size"]
+):
+    """Construit un index FAISS depuis la spec, l'entraîne sur un échantillon puis y ajoute les vecteurs"""
+    faiss = faiss_module()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        if len(vectors) > train_size:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), train_size, replace=False)]
+        else:
+            sample = vectors
+        started = time.perf_counter()
+        index.train(sample)
+        logger.info(f"Index {spec} entraîné sur {len(sample)} vecteurs en {time.perf_counter() - started:.1f}s")
+    if len(vectors):
+        index.add(vectors)
+    apply_search_params(index)
+    return index
+
+def index_memory_bytes(index) -> int:
+    faiss = faiss_module()
+    return int(faiss.serialize_index(index).nbytes)
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))] * 1000, 3)
+
+def evaluate_specs(
+    specs: List[str],
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10
+) -> List[Dict]:
+    """Recall@k par rapport à la recherche exacte, latence p50/p99 par requête et mémoire de chaque spec"""
+    faiss = faiss_module()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    report = []
+    for spec in specs:
+        if len(vectors) < min_training_vectors(spec):
+            report.append({"spec": spec, "error": f"au moins {min_training_vectors(spec)} vecteurs nécessaires"})
+            continue
+        started = time.perf_counter()
+        index = build_index(spec, vectors)
+        build_seconds = time.perf_counter() - started
+
+        latencies = []
+        hits = 0
+        for i, query in enumerate(queries):
+            # Requêtes une par une, comme en production
+            started = time.perf_counter()
+            _, found = index.search(query.reshape(1, -1), k)
+            latencies.append(time.perf_counter() - started)
+            hits += len(set(found[0]) & set(truth[i]))
+
+        report.append({
+            "spec": spec,
+            "vectors": int(index.ntotal),
+            "memory_bytes": index_memory_bytes(index),
+            "build_seconds": round(build_seconds, 3),
+            f"recall@{k}": round(hits / (k * len(queries)), 4) if len(queries) else None,
+            "latency_p50_ms": _percentile(latencies, 0.5),
+            "latency_p99_ms": _percentile(latencies, 0.99)
+        })
+    return report
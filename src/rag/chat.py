@@ -1,11 +1,11 @@
-from langchain_ollama import ChatOllama
-from langchain.schema import HumanMessage, SystemMessage
-from src.config import OLLAMA_CONFIG
-import requests
-import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-from src.rag.conversation_store import ConversationStore
+from src.rag.conversation_memory import ConversationMemory, ConversationTurn
+from src.rag.conversation_store import Conversation, ConversationStore
+from src.llm.ollama_client import OllamaClient
+from src.rag.response_cache import ResponseCache, make_params_key, chunk_ids_of, sources_of
+from src.rag.context_packer import ContextPacker
+from src.config import RETRIEVAL_TOP_K
 import uuid
 import logging
 
@@ -13,38 +13,54 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def format_context(docs: list) -> str:
+    """Met en forme les chunks récupérés avec leur source"""
+    context_parts = []
+    for doc in docs:
+        metadata = doc.metadata
+        source_info = f"Source: {metadata.get('filename', 'Inconnu')}"
+        date_info = f"Date: {metadata.get('date_added', 'Inconnue')}"
+        content = doc.page_content
+        context_parts.append(f"{source_info}\n{date_info}\n\nContenu:\n{content}\n")
+    return "\n---\n".join(context_parts)
+
 class RAGChat:
-    def __init__(self, vector_store):
+    def __init__(
+        self,
+        vector_store,
+        llm_client: Optional[OllamaClient] = None,
+        response_cache: Optional[ResponseCache] = None,
+        context_packer: Optional[ContextPacker] = None
+    ):
         logger.info("Initialisation de RAGChat")
         self.vector_store = vector_store
+        self.llm_client = llm_client or OllamaClient()
+        self.response_cache = response_cache
+        self.context_packer = context_packer or ContextPacker()
+        # Indique si la dernière réponse de generate_response provient du cache
+        self.last_response_cached = False
         self.conversation_store = ConversationStore()
+        self.memory = ConversationMemory(self.llm_client, self.conversation_store)
         self.conversation_id = str(uuid.uuid4())
+        self.conversation = Conversation(id=self.conversation_id)
         logger.info(f"Conversation ID créé: {self.conversation_id}")
 
+    @property
+    def conversation_history(self) -> List[Dict]:
+        return self.conversation.messages
+
     def get_context(self, query: str, k: int = 2) -> str:
         """Récupère le contexte pertinent pour la requête"""
         try:
-            relevant_docs = self.vector_store.similarity_search(query, k=k)
-            context_parts = []
-            
-            for doc in relevant_docs:
-                metadata = doc.metadata
-                source_info = f"Source: {metadata.get('filename', 'Inconnu')}"
-                date_info = f"Date: {metadata.get('date_added', 'Inconnue')}"
-                content = doc.page_content
-                context_parts.append(f"{source_info}\n{date_info}\n\nContenu:\n{content}\n")
-            
-            return "\n---\n".join(context_parts)
+            relevant_docs = self.vector_store.hybrid_search(query, k=k)
+            return format_context(relevant_docs)
         except Exception as e:
             print(f"Erreur lors de la recherche de contexte: {str(e)}")
             return ""
 
-    def _build_prompt(self, query: str, context: str) -> str:
-        """Construit le prompt avec l'historique"""
-        conversation_context = "\n".join([
-            f"{'Question' if msg['role'] == 'user' else 'Réponse'}: {msg['content']}"
-            for msg in self.conversation_history[-2:]  # Utiliser les 2 derniers messages
-        ])
+    def _build_prompt(self, query: str, context: str, history: Optional[str] = None) -> str:
+        """Construit le prompt avec l'historique : résumé glissant puis derniers échanges, de taille bornée"""
+        conversation_context = self.memory.render(self.conversation) if history is None else history
 
         return f"""Tu es un assistant expert qui aide à comprendre des documents.
 
@@ -55,7 +71,7 @@ Instructions :
 - Cite des parties du texte pour appuyer tes réponses
 - Prends en compte l'historique de la conversation pour plus de cohérence
 
-Historique récent de la conversation :
+Historique de la conversation :
 {conversation_context}
 
 Contexte des documents :
@@ -67,15 +83,13 @@ Réponse détaillée :"""
 
     def save_history(self):
         """Sauvegarde l'historique de la conversation"""
-        return self.conversation_store.save_conversation(
-            self.conversation_id, 
-            self.conversation_history
-        )
+        return self.conversation_store.save_conversation(self.conversation)
 
     def load_history(self, conversation_id: str):
         """Charge l'historique d'une conversation"""
         self.conversation_id = conversation_id
-        self.conversation_history = self.conversation_store.load_conversation(conversation_id)
+        self.conversation = self.conversation_store.get_or_create_conversation(conversation_id)
+        self.conversation.id = conversation_id
 
     def list_conversations(self):
         """Liste toutes les conversations disponibles"""
@@ -86,23 +100,56 @@ Réponse détaillée :"""
             logger.info(f"Génération de réponse pour: {query}")
             
             # Utiliser le conversation_id fourni ou celui créé
-            self.conversation_id = conversation_id or self.conversation_id
+            self.load_history(conversation_id or self.conversation_id)
             logger.info(f"Utilisation du conversation_id: {self.conversation_id}")
+            # Contexte KV du tour précédent si la conversation n'a pas changé depuis, sinon historique résumé
+            turn = self.memory.prepare(self.conversation_id, self.llm_client.model)
 
             # Rechercher les documents pertinents
             logger.info("Recherche de documents pertinents")
-            relevant_docs = self.vector_store.similarity_search(query)
-            logger.info(f"Nombre de documents trouvés: {len(relevant_docs)}")
-
-            # Générer la réponse avec le contexte
-            logger.info("Génération de la réponse avec le contexte")
-            response = self._generate_response_with_context(query, relevant_docs)
+            candidates = self.vector_store.hybrid_search(query, k=RETRIEVAL_TOP_K * 2)
+            logger.info(f"Nombre de documents trouvés: {len(candidates)}")
+
+            # Ne garder que ce qui tient dans la fenêtre de contexte du modèle
+            budget = self.context_packer.budget(
+                self._build_prompt(query, "", history=""), turn.history, len(turn.context or [])
+            )
+            relevant_docs = self.context_packer.pack_for_query(
+                candidates, budget, query, self.vector_store.embeddings
+            )
+
+            # Consulter le cache sémantique avant de solliciter le modèle
+            # La réponse dépend aussi de l'historique : le cache ne sert qu'aux débuts de conversation
+            response = None
+            kv_context = None
+            if self.response_cache is not None and not turn.has_history:
+                query_vector = self.vector_store.embeddings.embed_query(query)
+                params_key = make_params_key(self.llm_client.model)
+                response = self.response_cache.lookup(query_vector, chunk_ids_of(relevant_docs), params_key)
+            self.last_response_cached = response is not None
+
+            if response is None:
+                # Générer la réponse avec le contexte
+                logger.info("Génération de la réponse avec le contexte")
+                response, kv_context = self._generate_response_with_context(query, relevant_docs, turn)
+                if self.response_cache is not None and not turn.has_history:
+                    self.response_cache.put(
+                        query_vector, chunk_ids_of(relevant_docs), params_key,
+                        sources_of(relevant_docs), response
+                    )
             logger.info(f"Réponse générée: {response[:100]}...")  # Log des 100 premiers caractères
 
             # Sauvegarder la conversation
             logger.info("Sauvegarde de la conversation")
             self.conversation_store.save_message(self.conversation_id, "user", query)
-            self.conversation_store.save_message(self.conversation_id, "assistant", response)
+            conversation = self.conversation_store.save_message(self.conversation_id, "assistant", response)
+            # Le tour suivant repartira de ce contexte au lieu de réévaluer tout l'historique
+            self.memory.remember_context(conversation, self.llm_client.model, kv_context)
+            try:
+                self.memory.update_sync(self.conversation_id)
+            except Exception as e:
+                logger.warning(f"Résumé de la conversation non mis à jour: {str(e)}")
+            self.load_history(self.conversation_id)
 
             return response
 
@@ -110,17 +157,27 @@ Réponse détaillée :"""
             logger.error(f"Erreur dans generate_response: {str(e)}", exc_info=True)
             raise Exception(f"Erreur lors de la génération de la réponse: {str(e)}")
 
-    def _generate_response_with_context(self, query: str, relevant_docs: list) -> str:
+    def _generate_response_with_context(
+        self,
+        query: str,
+        relevant_docs: list,
+        turn: Optional[ConversationTurn] = None
+    ) -> Tuple[str, Optional[List[int]]]:
+        """Retourne la réponse et le contexte KV renvoyé par Ollama pour le tour suivant"""
         try:
             # Construire le contexte à partir des documents pertinents
-            context = "\n".join([doc.page_content for doc in relevant_docs])
+            context = format_context(relevant_docs)
             logger.info(f"Contexte construit avec {len(relevant_docs)} documents")
 
-            # Utiliser le modèle pour générer la réponse
-            from src.llm.ollama_client import get_ollama_response
-            response = get_ollama_response(query, context)
-            
-            return response
+            # Utiliser le modèle pour générer la réponse ; avec un contexte KV repris,
+            # seul le nouveau prompt est évalué par Ollama
+            history = turn.history if turn is not None else None
+            kv_context = turn.context if turn is not None else None
+            response_json = self.llm_client.generate_sync(self._build_prompt(query, context, history), context=kv_context)
+            if 'response' not in response_json:
+                logger.error(f"Réponse Ollama invalide: {response_json}")
+                return "Désolé, je n'ai pas pu générer une réponse cohérente.", None
+            return response_json['response'], response_json.get('context')
 
         except Exception as e:
             logger.error(f"Erreur dans _generate_response_with_context: {str(e)}", exc_info=True)
@@ -0,0 +1,139 @@
+from functools import lru_cache
+from typing import List, Optional
+from langchain_core.documents import Document
+from src.config import CHUNK_OVERLAP, CONTEXT_PACKING_CONFIG, DEFAULT_LLM_PARAMS
+import re
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Tokens ajoutés par format_context autour de chaque chunk (source, date, séparateurs)
+CHUNK_HEADER_TOKENS = 24
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Estimation du nombre de tokens (mots et ponctuation, au moins 1 token pour 4 caractères)"""
+    return max(len(TOKEN_PATTERN.findall(text)), len(text) // 4)
+
+def _overlap_length(previous: str, current: str, max_overlap: int) -> int:
+    """Longueur du plus long suffixe de previous qui est aussi un préfixe de current"""
+    for length in range(min(max_overlap, len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:length]):
+            return length
+    return 0
+
+class ContextPacker:
+    """Sélectionne les chunks à envoyer au modèle sous un budget de tokens"""
+
+    def __init__(
+        self,
+        context_window: int = CONTEXT_PACKING_CONFIG["context_window"],
+        max_output_tokens: int = DEFAULT_LLM_PARAMS["max_tokens"],
+        history_tokens: int = CONTEXT_PACKING_CONFIG["history_tokens"],
+        strategy: str = CONTEXT_PACKING_CONFIG["strategy"],
+        mmr_lambda: float = CONTEXT_PACKING_CONFIG["mmr_lambda"]
+    ):
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.history_tokens = history_tokens
+        self.strategy = strategy
+        self.mmr_lambda = mmr_lambda
+
+    def budget(self, prompt_template: str, history: str = "", context_tokens: int = 0) -> int:
+        """Tokens disponibles pour le contexte une fois réservés la sortie, le gabarit et l'historique.
+
+        context_tokens : taille du contexte KV repris du tour précédent, qui tient lieu d'historique.
+        """
+        if context_tokens:
+            history_tokens = context_tokens
+        else:
+            history_tokens = count_tokens(history) if history else self.history_tokens
+        return max(0, self.context_window - self.max_output_tokens - count_tokens(prompt_template) - history_tokens)
+
+    @staticmethod
+    def _trim_overlap(doc: Document, by_position: dict) -> str:
+        """Contenu du chunk privé du recouvrement (CHUNK_OVERLAP) avec ses voisins déjà retenus"""
+        content = doc.page_content
+        source = doc.metadata.get("source")
+        index = doc.metadata.get("chunk_index")
+        if source is None or index is None:
+            return content
+        previous = by_position.get((source, index - 1))
+        following = by_position.get((source, index + 1))
+        start = _overlap_length(previous.page_content, content, CHUNK_OVERLAP) if previous else 0
+        end = len(content) - (_overlap_length(content, following.page_content, CHUNK_OVERLAP) if following else 0)
+        return content[start:end] if start < end else ""
+
+    def _mmr_order(self, docs: List[Document], query_vector: List[float], doc_vectors: List[List[float]]) -> List[Document]:
+        """Ordonne les chunks par maximal marginal relevance (pertinence moins redondance)"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        vectors = np.asarray(doc_vectors, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+        relevance = vectors @ query
+
+        remaining = list(range(len(docs)))
+        order = []
+        while remaining:
+            if order:
+                redundancy = (vectors[remaining] @ vectors[order].T).max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            order.append(remaining.pop(int(np.argmax(scores))))
+        return [docs[i] for i in order]
+
+    def pack(
+        self,
+        docs: List[Document],
+        budget: int,
+        query_vector: Optional[List[float]] = None,
+        doc_vectors: Optional[List[List[float]]] = None
+    ) -> List[Document]:
+        """Retient les chunks qui tiennent dans le budget, dans l'ordre de pertinence.
+
+        Doublons et recouvrement ne sont comptés que face aux chunks déjà retenus : un chunk écarté
+        faute de place ne fait pas raccourcir son voisin.
+        """
+        if self.strategy == "mmr" and query_vector is not None and doc_vectors is not None and docs:
+            docs = self._mmr_order(docs, query_vector, doc_vectors)
+
+        selected = []
+        selected_contents = set()
+        # Chunks retenus par (source, chunk_index), texte original : seul le recouvrement avec eux est retiré
+        by_position = {}
+        used = 0
+        for doc in docs:
+            if doc.page_content in selected_contents:
+                continue
+            content = self._trim_overlap(doc, by_position)
+            if not content.strip():
+                continue
+            cost = count_tokens(content) + CHUNK_HEADER_TOKENS
+            if used + cost > budget:
+                continue
+            selected.append(Document(page_content=content, metadata=doc.metadata))
+            selected_contents.add(doc.page_content)
+            if doc.metadata.get("source") is not None and doc.metadata.get("chunk_index") is not None:
+                by_position[(doc.metadata["source"], doc.metadata["chunk_index"])] = doc
+            used += cost
+        logger.info(f"Contexte: {len(selected)}/{len(docs)} chunks retenus ({used}/{budget} tokens)")
+        return selected
+
+    def pack_for_query(self, docs: List[Document], budget: int, query: str, embeddings) -> List[Document]:
+        """pack() en calculant les vecteurs nécessaires à la stratégie MMR (servis par le cache d'embeddings)"""
+        if self.strategy != "mmr" or not docs:
+            return self.pack(docs, budget)
+        query_vector = embeddings.embed_query(query)
+        doc_vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        return self.pack(docs, budget, query_vector, doc_vectors)
+
+    async def apack_for_query(self, docs: List[Document], budget: int, query: str, embeddings) -> List[Document]:
+        if self.strategy != "mmr" or not docs:
+            return self.pack(docs, budget)
+        query_vector = await embeddings.aembed_query(query)
+        doc_vectors = await embeddings.aembed_documents([doc.page_content for doc in docs])
+        return self.pack(docs, budget, query_vector, doc_vectors)
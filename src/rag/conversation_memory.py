@@ -0,0 +1,186 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from src.config import CONTEXT_PACKING_CONFIG, CONVERSATION_MEMORY_CONFIG, KV_CONTEXT_CONFIG
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import PRIORITY_BATCH
+from src.rag.context_packer import count_tokens
+from src.rag.conversation_store import Conversation, ConversationStore
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Tu tiens à jour le résumé d'une conversation entre un utilisateur et un assistant.
+
+Résumé actuel :
+{summary}
+
+Nouveaux échanges à intégrer :
+{messages}
+
+Réécris le résumé en y intégrant les nouveaux échanges : faits établis, questions posées, réponses données,
+préférences exprimées. Au plus {max_words} mots, en français, sans introduction."""
+
+def format_message(message: Dict) -> str:
+    return f"{'Question' if message['role'] == 'user' else 'Réponse'}: {message['content']}"
+
+def prefix_hash(conversation: Conversation, model: str) -> str:
+    """Empreinte de l'état de la conversation auquel correspond un contexte KV"""
+    last = conversation.messages[-1]["content"] if conversation.messages else ""
+    return hashlib.sha256(f"{model}\0{len(conversation.messages)}\0{last}".encode("utf-8")).hexdigest()
+
+@dataclass
+class ConversationTurn:
+    """Ce qu'un nouveau tour envoie au modèle en plus de la question"""
+    # Historique à insérer dans le prompt, "" quand le contexte KV le contient déjà
+    history: str
+    # Contexte KV du tour précédent, None quand tout le prompt doit être évalué
+    context: Optional[List[int]]
+    # La conversation a déjà des échanges (la réponse ne peut pas venir du cache de réponses)
+    has_history: bool
+
+class ConversationMemory:
+    """Historique borné d'une conversation : résumé glissant des échanges anciens + derniers échanges in extenso.
+
+    Quand les échanges non résumés dépassent le budget, les plus anciens sont intégrés au résumé :
+    seuls ces échanges et le résumé précédent sont envoyés au modèle, jamais toute la conversation.
+    """
+
+    def __init__(
+        self,
+        llm_client: OllamaClient,
+        store: Optional[ConversationStore] = None,
+        history_tokens: int = CONTEXT_PACKING_CONFIG["history_tokens"],
+        summary_tokens: int = CONVERSATION_MEMORY_CONFIG["summary_tokens"],
+        fold_ratio: float = CONVERSATION_MEMORY_CONFIG["fold_ratio"],
+        reuse_context: bool = KV_CONTEXT_CONFIG["enabled"]
+    ):
+        self.llm_client = llm_client
+        self.store = store or ConversationStore()
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.fold_ratio = fold_ratio
+        self.reuse_context = reuse_context
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _recent_budget(self, conversation: Conversation) -> int:
+        return max(0, self.history_tokens - count_tokens(conversation.summary))
+
+    @staticmethod
+    def _split(conversation: Conversation, budget: int) -> Tuple[List[Dict], List[Dict]]:
+        """(messages non résumés qui débordent du budget, derniers messages qui y tiennent)"""
+        pending = conversation.messages[conversation.summarized_count:]
+        used = 0
+        start = len(pending)
+        while start > 0:
+            cost = count_tokens(format_message(pending[start - 1]))
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return pending[:start], pending[start:]
+
+    def render(self, conversation: Conversation) -> str:
+        """Historique à insérer dans le prompt, borné par history_tokens.
+
+        Les messages qui débordent et ne sont pas encore résumés sont omis jusqu'au prochain update().
+        """
+        _, recent = self._split(conversation, self._recent_budget(conversation))
+        parts = []
+        if conversation.summary:
+            parts.append(f"Résumé des échanges précédents :\n{conversation.summary}")
+        if recent:
+            parts.append("Échanges récents :\n" + "\n".join(format_message(message) for message in recent))
+        return "\n\n".join(parts)
+
+    def prepare(self, conversation_id: Optional[str], model: str) -> ConversationTurn:
+        """Historique du prochain tour : le contexte KV du tour précédent s'il correspond encore à la
+        conversation (seul le nouveau prompt est alors évalué), sinon le résumé et les derniers échanges"""
+        if not conversation_id:
+            return ConversationTurn(history="", context=None, has_history=False)
+        conversation = self.store.get_or_create_conversation(conversation_id)
+        if not conversation.messages:
+            return ConversationTurn(history="", context=None, has_history=False)
+        if self.reuse_context:
+            context = self.store.contexts.get(conversation_id, model, prefix_hash(conversation, model))
+            if context:
+                return ConversationTurn(history="", context=context, has_history=True)
+        return ConversationTurn(history=self.render(conversation), context=None, has_history=True)
+
+    def remember_context(self, conversation: Conversation, model: str, context: Optional[List[int]]) -> None:
+        """Conserve le contexte renvoyé par Ollama pour l'état de la conversation qui vient d'être enregistré"""
+        if not self.reuse_context or not context:
+            return
+        if not self.store.contexts.put(conversation.id, model, prefix_hash(conversation, model), context):
+            logger.info(f"Contexte KV de la conversation {conversation.id} trop long, le prochain tour repart du résumé")
+
+    def _to_fold(self, conversation: Conversation) -> List[Dict]:
+        """Messages à intégrer au résumé, assez pour laisser de la marge avant le prochain résumé"""
+        overflow, _ = self._split(conversation, self._recent_budget(conversation))
+        if not overflow:
+            return []
+        to_fold, _ = self._split(conversation, int(self._recent_budget(conversation) * self.fold_ratio))
+        return to_fold
+
+    def _summary_request(self, conversation: Conversation, messages: List[Dict]) -> Tuple[str, Dict]:
+        prompt = SUMMARY_PROMPT.format(
+            summary=conversation.summary or "(vide)",
+            messages="\n".join(format_message(message) for message in messages),
+            # Environ 0,75 mot par token
+            max_words=int(self.summary_tokens * 0.75)
+        )
+        return prompt, {"num_predict": self.summary_tokens, "temperature": 0.2}
+
+    def _apply(self, conversation: Conversation, messages: List[Dict], summary: str) -> bool:
+        previous_count = conversation.summarized_count
+        summarized_count = previous_count + len(messages)
+        if not summary or not self.store.save_summary(conversation.id, summary, summarized_count, previous_count):
+            return False
+        conversation.summary = summary
+        conversation.summarized_count = summarized_count
+        logger.info(f"Résumé de la conversation {conversation.id} mis à jour ({summarized_count} messages résumés)")
+        return True
+
+    async def update(self, conversation_id: str) -> bool:
+        """Intègre au résumé les échanges qui débordent du budget ; retourne True si le résumé a changé"""
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            conversation = self.store.get_or_create_conversation(conversation_id)
+            messages = self._to_fold(conversation)
+            if not messages:
+                return False
+            prompt, options = self._summary_request(conversation, messages)
+            result = await self.llm_client.generate(prompt, options, priority=PRIORITY_BATCH)
+            return self._apply(conversation, messages, result.get("response", "").strip())
+
+    def update_sync(self, conversation_id: str) -> bool:
+        conversation = self.store.get_or_create_conversation(conversation_id)
+        messages = self._to_fold(conversation)
+        if not messages:
+            return False
+        prompt, options = self._summary_request(conversation, messages)
+        result = self.llm_client.generate_sync(prompt, options, priority=PRIORITY_BATCH)
+        return self._apply(conversation, messages, result.get("response", "").strip())
+
+    async def _update_quietly(self, conversation_id: str) -> None:
+        try:
+            await self.update(conversation_id)
+        except Exception as e:
+            logger.warning(f"Résumé de la conversation {conversation_id} non mis à jour: {str(e)}")
+        finally:
+            lock = self._locks.get(conversation_id)
+            if lock is not None and not lock.locked():
+                del self._locks[conversation_id]
+
+    def schedule_update(self, conversation_id: str) -> None:
+        """Lance update() en tâche de fond, après la réponse, pour ne pas retarder l'utilisateur"""
+        task = asyncio.create_task(self._update_quietly(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
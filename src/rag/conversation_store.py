@@ -1,17 +1,31 @@
 import json
 import os
+import base64
+import sqlite3
+import time
+from array import array
 from datetime import datetime
 import uuid
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from src.config import CONVERSATION_PAGE_SIZE, KV_CONTEXT_CONFIG
+from src.metrics import timed
 import logging
 
 logger = logging.getLogger(__name__)
 
+class InvalidCursorError(ValueError):
+    """Curseur de pagination illisible (tronqué, modifié ou forgé par le client)"""
+
 class Conversation:
-    def __init__(self, id: str = None, messages: List[Dict] = None):
+    def __init__(self, id: str = None, messages: List[Dict] = None, summary: str = "", summarized_count: int = 0):
         self.id = id or str(uuid.uuid4())
         self.messages = messages or []
-        self.timestamp = datetime.now().isoformat()
+        # Résumé glissant des summarized_count premiers messages (voir ConversationMemory)
+        self.summary = summary
+        self.summarized_count = summarized_count
+        # Date de la dernière activité, celle du dernier message enregistré le cas échéant
+        self.timestamp = self.messages[-1].get("timestamp") if self.messages else None
+        self.timestamp = self.timestamp or datetime.now().isoformat()
 
     def add_message(self, role: str, content: str):
         message = {
@@ -20,27 +34,245 @@ class Conversation:
             "timestamp": datetime.now().isoformat()
         }
         self.messages.append(message)
+        self.timestamp = message["timestamp"]
+
+    @property
+    def title(self) -> str:
+        return self.messages[0]["content"][:50] if self.messages else "Nouvelle conversation"
 
     def to_dict(self):
         return {
             "id": self.id,
             "messages": self.messages,
             "timestamp": self.timestamp,
-            "title": self.messages[0]["content"][:50] if self.messages else "Nouvelle conversation",
+            "title": self.title,
             "messageCount": len(self.messages)
         }
 
+class ConversationCatalog:
+    """Index SQLite des conversations (titre, activité, résumé glissant), mis à jour à chaque écriture"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, title TEXT NOT NULL, message_count INTEGER NOT NULL, "
+            "created_at TEXT NOT NULL, last_activity TEXT NOT NULL, "
+            "summary TEXT NOT NULL DEFAULT '', summarized_count INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_activity "
+            "ON conversations(last_activity DESC, id DESC)"
+        )
+        self._conn.commit()
+
+    def is_empty(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchone() is None
+
+    def upsert(self, conversation: Conversation, commit: bool = True) -> None:
+        created_at = conversation.messages[0].get("timestamp") if conversation.messages else None
+        # Le résumé n'est modifié que par set_summary
+        self._conn.execute(
+            "INSERT INTO conversations (id, title, message_count, created_at, last_activity) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET title = excluded.title, "
+            "message_count = excluded.message_count, last_activity = excluded.last_activity",
+            (
+                conversation.id,
+                conversation.title,
+                len(conversation.messages),
+                created_at or conversation.timestamp,
+                conversation.timestamp
+            )
+        )
+        if commit:
+            self._conn.commit()
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def get_summary(self, conversation_id: str) -> Tuple[str, int]:
+        row = self._conn.execute(
+            "SELECT summary, summarized_count FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def set_summary(self, conversation_id: str, summary: str, summarized_count: int, previous_count: int) -> bool:
+        """Enregistre le résumé si personne ne l'a avancé entre-temps (autre worker, tâche concurrente)"""
+        cursor = self._conn.execute(
+            "UPDATE conversations SET summary = ?, summarized_count = ? WHERE id = ? AND summarized_count = ?",
+            (summary, summarized_count, conversation_id, previous_count)
+        )
+        self._conn.commit()
+        return cursor.rowcount == 1
+
+    def delete(self, conversation_id: str) -> None:
+        self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @staticmethod
+    def encode_cursor(last_activity: str, conversation_id: str) -> str:
+        return base64.urlsafe_b64encode(f"{last_activity}|{conversation_id}".encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, str]:
+        try:
+            # binascii.Error, UnicodeError et un séparateur absent sont tous des ValueError
+            last_activity, conversation_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split("|", 1)
+        except ValueError:
+            raise InvalidCursorError(f"Curseur de pagination invalide: {cursor!r}") from None
+        return last_activity, conversation_id
+
+    def page(self, limit: Optional[int], cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Retourne une page triée par dernière activité décroissante et le curseur de la page suivante"""
+        query = "SELECT id, title, message_count, last_activity FROM conversations"
+        params: list = []
+        if cursor:
+            last_activity, conversation_id = self.decode_cursor(cursor)
+            query += " WHERE last_activity < ? OR (last_activity = ? AND id < ?)"
+            params += [last_activity, last_activity, conversation_id]
+        query += " ORDER BY last_activity DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+        rows = self._conn.execute(query, params).fetchall()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1][3], rows[-1][0])
+        conversations = [
+            {"id": row[0], "title": row[1], "messageCount": row[2], "timestamp": row[3]}
+            for row in rows
+        ]
+        return conversations, next_cursor
+
+class ConversationContextCache:
+    """Contextes KV d'Ollama par conversation, dans le catalogue, bornés en taille et évincés par LRU.
+
+    Un contexte n'est valable que pour l'état de la conversation qui l'a produit (prefix_hash) :
+    au moindre écart (modèle, message ajouté par ailleurs), il est supprimé au lieu d'être réutilisé.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = KV_CONTEXT_CONFIG["cache_max_bytes"],
+        max_tokens: int = KV_CONTEXT_CONFIG["max_tokens"]
+    ):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_contexts ("
+            "conversation_id TEXT PRIMARY KEY, model TEXT NOT NULL, prefix_hash TEXT NOT NULL, "
+            "context BLOB NOT NULL, size_bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversation_contexts_access ON conversation_contexts(last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, conversation_id: str, model: str, prefix_hash: str) -> Optional[List[int]]:
+        row = self._conn.execute(
+            "SELECT model, prefix_hash, context FROM conversation_contexts WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] != model or row[1] != prefix_hash:
+            self.delete(conversation_id)
+            return None
+        self._conn.execute(
+            "UPDATE conversation_contexts SET last_access = ? WHERE conversation_id = ?",
+            (time.time(), conversation_id)
+        )
+        self._conn.commit()
+        context = array("i")
+        context.frombytes(row[2])
+        return context.tolist()
+
+    def put(self, conversation_id: str, model: str, prefix_hash: str, context: List[int]) -> bool:
+        """Enregistre le contexte ; un contexte trop long est écarté et le tour suivant repart de zéro"""
+        if not context or len(context) > self.max_tokens:
+            self.delete(conversation_id)
+            return False
+        data = array("i", context).tobytes()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversation_contexts "
+            "(conversation_id, model, prefix_hash, context, size_bytes, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, model, prefix_hash, data, len(data), time.time())
+        )
+        self._evict()
+        self._conn.commit()
+        return True
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM conversation_contexts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for conversation_id, size_bytes in self._conn.execute(
+            "SELECT conversation_id, size_bytes FROM conversation_contexts ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((conversation_id,))
+            total -= size_bytes
+        self._conn.executemany("DELETE FROM conversation_contexts WHERE conversation_id = ?", evicted)
+        logger.info(f"{len(evicted)} contextes KV évincés du cache des conversations")
+
+    def delete(self, conversation_id: str) -> None:
+        self._conn.execute("DELETE FROM conversation_contexts WHERE conversation_id = ?", (conversation_id,))
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
 class ConversationStore:
     def __init__(self, storage_dir: str = "conversations"):
         self.storage_dir = storage_dir
         if not os.path.exists(storage_dir):
             os.makedirs(storage_dir)
+        self.catalog = ConversationCatalog(os.path.join(storage_dir, "catalog.sqlite"))
+        self.contexts = ConversationContextCache(os.path.join(storage_dir, "catalog.sqlite"))
+        if self.catalog.is_empty():
+            self._rebuild_catalog()
+
+    def close(self) -> None:
+        self.catalog.close()
+        self.contexts.close()
+
+    def _conversation_files(self) -> List[str]:
+        return [filename for filename in os.listdir(self.storage_dir) if filename.endswith('.json')]
+
+    def _rebuild_catalog(self) -> None:
+        """Reconstruit le catalogue depuis les fichiers (première utilisation ou catalogue perdu)"""
+        filenames = self._conversation_files()
+        for filename in filenames:
+            conversation_id = filename[:-len('.json')]
+            messages = self.load_conversation(conversation_id)
+            self.catalog.upsert(Conversation(id=conversation_id, messages=messages), commit=False)
+        self.catalog.commit()
+        if filenames:
+            logger.info(f"Catalogue des conversations reconstruit ({len(filenames)} conversations)")
 
     def get_or_create_conversation(self, conversation_id: Optional[str] = None) -> Conversation:
         if conversation_id:
             conversation_data = self.load_conversation(conversation_id)
             if conversation_data:
-                return Conversation(id=conversation_id, messages=conversation_data)
+                summary, summarized_count = self.catalog.get_summary(conversation_id)
+                return Conversation(
+                    id=conversation_id,
+                    messages=conversation_data,
+                    summary=summary,
+                    summarized_count=min(summarized_count, len(conversation_data))
+                )
         return Conversation()
 
     def save_conversation(self, conversation: Conversation) -> None:
@@ -48,11 +280,24 @@ class ConversationStore:
             file_path = os.path.join(self.storage_dir, f"{conversation.id}.json")
             with open(file_path, 'w', encoding='utf-8') as f:
                 json.dump(conversation.messages, f, ensure_ascii=False, indent=2)
+            self.catalog.upsert(conversation)
             logger.info(f"Conversation {conversation.id} sauvegardée")
         except Exception as e:
             logger.error(f"Erreur lors de la sauvegarde de la conversation: {str(e)}")
             raise
 
+    def save_message(self, conversation_id: str, role: str, content: str) -> Conversation:
+        """Ajoute un message à la conversation, la sauvegarde et la retourne"""
+        with timed("conversation_save"):
+            conversation = self.get_or_create_conversation(conversation_id)
+            conversation.id = conversation_id
+            conversation.add_message(role, content)
+            self.save_conversation(conversation)
+            return conversation
+
+    def save_summary(self, conversation_id: str, summary: str, summarized_count: int, previous_count: int) -> bool:
+        return self.catalog.set_summary(conversation_id, summary, summarized_count, previous_count)
+
     def load_conversation(self, conversation_id: str) -> List[Dict]:
         try:
             file_path = os.path.join(self.storage_dir, f"{conversation_id}.json")
@@ -64,16 +309,15 @@ class ConversationStore:
             logger.error(f"Erreur lors du chargement de la conversation: {str(e)}")
             return []
 
+    def list_conversations_page(self, limit: Optional[int] = CONVERSATION_PAGE_SIZE, cursor: Optional[str] = None) -> Dict:
+        """Page de résumés de conversations, triée par dernière activité"""
+        conversations, next_cursor = self.catalog.page(limit, cursor)
+        return {"conversations": conversations, "next_cursor": next_cursor}
+
     def list_conversations(self) -> List[Dict]:
         try:
-            conversations = []
-            for filename in os.listdir(self.storage_dir):
-                if filename.endswith('.json'):
-                    conversation_id = filename.replace('.json', '')
-                    messages = self.load_conversation(conversation_id)
-                    conv = Conversation(id=conversation_id, messages=messages)
-                    conversations.append(conv.to_dict())
-            return sorted(conversations, key=lambda x: x['timestamp'], reverse=True)
+            conversations, _ = self.catalog.page(None)
+            return conversations
         except Exception as e:
             logger.error(f"Erreur lors du listage des conversations: {str(e)}")
             return []
@@ -83,6 +327,8 @@ class ConversationStore:
             file_path = os.path.join(self.storage_dir, f"{conversation_id}.json")
             if os.path.exists(file_path):
                 os.remove(file_path)
+                self.catalog.delete(conversation_id)
+                self.contexts.delete(conversation_id)
                 logger.info(f"Conversation {conversation_id} supprimée")
             else:
                 raise FileNotFoundError(f"Conversation {conversation_id} non trouvée")
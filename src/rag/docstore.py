@@ -0,0 +1,150 @@
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+import json
+import os
+import sqlite3
+import threading
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore LangChain dans un fichier SQLite.
+
+    Ouvert en lecture seule, le fichier d'une génération publiée est immuable : tous les workers
+    le lisent à travers le cache de pages du système au lieu d'en garder chacun une copie en mémoire.
+    Le même fichier porte la table position FAISS -> id du chunk (voir SQLiteIdMap).
+    """
+
+    def __init__(self, path: str, read_only: bool = True):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Fichier de travail jetable tant qu'il n'est pas publié : pas de journal
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        # content_hash à part, indexé : la recherche lexicale filtre ses postings sur le contenu
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL, content_hash TEXT)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS index_ids (position INTEGER PRIMARY KEY, id TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def create(cls, path: str, source: Optional["SQLiteDocstore"] = None) -> "SQLiteDocstore":
+        """Docstore modifiable, initialisé avec le contenu de source"""
+        if os.path.exists(path):
+            os.remove(path)
+        docstore = cls(path, read_only=False)
+        if source is not None:
+            with source._lock:
+                source._conn.backup(docstore._conn)
+        return docstore
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        if not texts:
+            return
+        ids = list(texts)
+        with self._lock:
+            overlapping = []
+            # Par lots, sous la limite de variables d'une requête SQLite
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                overlapping.extend(
+                    row[0] for row in self._conn.execute(
+                        f"SELECT id FROM documents WHERE id IN ({placeholders})", batch
+                    )
+                )
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            self._conn.executemany(
+                "INSERT INTO documents (id, page_content, metadata, content_hash) VALUES (?, ?, ?, ?)",
+                [
+                    (doc_id, doc.page_content, json.dumps(doc.metadata), doc.metadata.get("content_hash"))
+                    for doc_id, doc in texts.items()
+                ]
+            )
+            self._conn.commit()
+
+    def ids_with_content(self, content_hashes: List[str]) -> Set[str]:
+        """Ids des chunks de ces contenus, lus dans l'index de la colonne content_hash"""
+        ids: Set[str] = set()
+        with self._lock:
+            for start in range(0, len(content_hashes), 500):
+                batch = content_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                ids.update(
+                    row[0] for row in self._conn.execute(
+                        f"SELECT id FROM documents WHERE content_hash IN ({placeholders})", batch
+                    )
+                )
+        return ids
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.commit()
+
+    def write_index_ids(self, index_to_docstore_id: Dict[int, str]) -> None:
+        """Remplace la table position -> id du chunk avant publication"""
+        with self._lock:
+            self._conn.execute("DELETE FROM index_ids")
+            self._conn.executemany(
+                "INSERT INTO index_ids (position, id) VALUES (?, ?)",
+                sorted(index_to_docstore_id.items())
+            )
+            self._conn.commit()
+
+    def index_ids(self) -> "SQLiteIdMap":
+        return SQLiteIdMap(self)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class SQLiteIdMap(Mapping):
+    """index_to_docstore_id en lecture seule, lu dans le docstore au lieu d'être chargé en mémoire"""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._docstore._lock:
+            return self._docstore._conn.execute(sql, params).fetchall()
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._query("SELECT id FROM index_ids WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([row[0] for row in self._query("SELECT position FROM index_ids ORDER BY position")])
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM index_ids")[0][0]
+
+    def items(self) -> List[Tuple[int, str]]:
+        return self._query("SELECT position, id FROM index_ids ORDER BY position")
+
+    def values(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT id FROM index_ids ORDER BY position")]
@@ -1,66 +1,103 @@
-from typing import Dict, List, Set
-import re
+from typing import Dict, List, Optional
+from dataclasses import dataclass, asdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from collections import Counter
-import nltk
-from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.corpus import stopwords
+import os
+
+@dataclass
+class DocumentStats:
+    char_count: int
+    word_count: int
+    sentence_count: int
+    avg_word_length: float
+    avg_sentence_length: float
+
+@dataclass
+class ComplexityStats:
+    vocabulary_diversity: float
+    avg_sentence_complexity: float
+
+@dataclass
+class DocumentAnalysis:
+    stats: DocumentStats
+    tags: List[str]
+    complexity: ComplexityStats
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+# Analyseur propre à chaque processus du pool, créé au premier usage
+_worker_analyzer: Optional["DocumentAnalyzer"] = None
+
+def _analyze_in_worker(text: str) -> DocumentAnalysis:
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = DocumentAnalyzer()
+    return _worker_analyzer.analyze_document(text)
 
 class DocumentAnalyzer:
     def __init__(self):
+        # Import différé : NLTK n'est chargé qu'à la première analyse, pas au démarrage de l'API
+        from nltk.tokenize import word_tokenize, sent_tokenize
+        from nltk.corpus import stopwords
+        self._word_tokenize = word_tokenize
+        self._sent_tokenize = sent_tokenize
         self.stop_words = set(stopwords.words('french'))
 
-    def analyze_document(self, text: str) -> Dict:
+    def _tokenize(self, text: str) -> List[List[str]]:
+        """Découpe le texte en phrases puis en tokens, en une seule passe"""
+        return [self._word_tokenize(sentence) for sentence in self._sent_tokenize(text)]
+
+    def terms(self, text: str) -> List[str]:
+        """Mots alphanumériques en minuscules, hors mots vides (termes de l'index lexical)"""
+        return [
+            token for token in (t.lower() for sentence in self._tokenize(text) for t in sentence)
+            if token.isalnum() and token not in self.stop_words
+        ]
+
+    def analyze_document(self, text: str) -> DocumentAnalysis:
         """Analyse un document et retourne ses métadonnées"""
+        sentences = self._tokenize(text)
+        tokens = [token.lower() for sentence in sentences for token in sentence]
+        words = [w for w in tokens if w.isalnum()]  # Garder seulement les mots alphanumériques
+
         # Statistiques de base
-        stats = self._get_basic_stats(text)
-        
-        # Extraction de tags
-        tags = self._extract_tags(text)
-        
+        stats = DocumentStats(
+            char_count=len(text),
+            word_count=len(words),
+            sentence_count=len(sentences),
+            avg_word_length=sum(len(w) for w in words) / len(words) if words else 0,
+            avg_sentence_length=len(words) / len(sentences) if sentences else 0
+        )
+
+        # Extraction de tags : les mots les plus fréquents hors mots vides
+        word_freq = Counter(w for w in words if w not in self.stop_words)
+        tags = [word for word, _ in word_freq.most_common(5)]
+
         # Analyse de complexité
-        complexity = self._analyze_complexity(text)
-        
-        return {
-            "stats": stats,
-            "tags": list(tags),
-            "complexity": complexity
-        }
-
-    def _get_basic_stats(self, text: str) -> Dict:
-        """Calcule les statistiques de base du texte"""
-        sentences = sent_tokenize(text)
-        words = word_tokenize(text.lower())
-        words = [w for w in words if w.isalnum()]  # Garder seulement les mots alphanumériques
-        
-        return {
-            "char_count": len(text),
-            "word_count": len(words),
-            "sentence_count": len(sentences),
-            "avg_word_length": sum(len(w) for w in words) / len(words) if words else 0,
-            "avg_sentence_length": len(words) / len(sentences) if sentences else 0
-        }
-
-    def _extract_tags(self, text: str) -> Set[str]:
-        """Extrait des tags pertinents du texte"""
-        words = word_tokenize(text.lower())
-        words = [w for w in words if w.isalnum() and w not in self.stop_words]
-        
-        # Compter les occurrences des mots
-        word_freq = Counter(words)
-        
-        # Prendre les N mots les plus fréquents comme tags
-        top_words = word_freq.most_common(5)
-        return {word for word, _ in top_words}
-
-    def _analyze_complexity(self, text: str) -> Dict:
-        """Analyse la complexité du texte"""
-        sentences = sent_tokenize(text)
-        words = word_tokenize(text.lower())
-        
-        # Calculer la diversité du vocabulaire
-        unique_words = set(words)
-        
-        return {
-            "vocabulary_diversity": len(unique_words) / len(words) if words else 0,
-            "avg_sentence_complexity": sum(len(word_tokenize(s)) for s in sentences) / len(sentences) if sentences else 0
-        }
+        complexity = ComplexityStats(
+            vocabulary_diversity=len(set(tokens)) / len(tokens) if tokens else 0,
+            avg_sentence_complexity=len(tokens) / len(sentences) if sentences else 0
+        )
+
+        return DocumentAnalysis(stats=stats, tags=tags, complexity=complexity)
+
+    def analyze_batch(
+        self,
+        texts: List[str],
+        max_workers: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ) -> List[DocumentAnalysis]:
+        """Analyse plusieurs textes sur un pool de processus, dans l'ordre d'entrée.
+
+        executor : pool existant (ses workers gardent leur analyseur d'un appel à l'autre) ;
+        à défaut, un pool est créé pour l'appel.
+        """
+        if len(texts) < 2 or max_workers == 1:
+            return [self.analyze_document(text) for text in texts]
+        max_workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(texts) // (max_workers * 4))
+        if executor is not None:
+            return list(executor.map(_analyze_in_worker, texts, chunksize=chunksize))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_analyze_in_worker, texts, chunksize=chunksize))
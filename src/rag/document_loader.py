@@ -1,28 +1,40 @@
 import os
-from minio import Minio
-from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import io
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import logging
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, DirectoryLoader, PDFPlumberLoader
-from langchain.schema import Document
-import shutil
+from langchain_core.documents import Document
 from fastapi import UploadFile
-from pypdf import PdfReader
-import pdfplumber
+from src.cloud_storage.blob_store import LocalBlobStore, MinioBlobStore, sha256_file
+from src.cloud_storage.object_fetcher import MinioFetcher, ObjectCache
+from src.rag.extraction_cache import ExtractionCache
+from src.rag.pdf_extraction import extract_pdf_pages
+from src.config import MINIO_CONFIG, UPLOAD_CHUNK_SIZE
+from src.metrics import timed
+import asyncio
+import hashlib
+import uuid
+
+if TYPE_CHECKING:
+    from minio import Minio
 
 logger = logging.getLogger(__name__)
 
 class MinioStorage:
-    def __init__(self):
-        self.client = Minio(
-            "localhost:9000",
-            access_key="minioadmin",
-            secret_key="minioadmin",
-            secure=False
-        )
+    def __init__(self, client: Optional["Minio"] = None, cache: Optional[ObjectCache] = None):
+        # Le client est injectable pour tester contre un MinIO local ou un serveur S3 factice
+        if client is None:
+            # Import différé : minio n'est chargé que si le stockage objet est utilisé
+            from minio import Minio
+            client = Minio(
+                MINIO_CONFIG["endpoint"],
+                access_key=MINIO_CONFIG["access_key"],
+                secret_key=MINIO_CONFIG["secret_key"],
+                secure=MINIO_CONFIG["secure"]
+            )
+        self.client = client
         self.bucket_name = "documents"
         self._ensure_bucket_exists()
+        self.fetcher = MinioFetcher(self.client, self.bucket_name, cache=cache or ObjectCache())
+        self.blob_store = MinioBlobStore(self.client, self.bucket_name, fetcher=self.fetcher)
 
     def _ensure_bucket_exists(self):
         try:
@@ -33,76 +45,133 @@ class MinioStorage:
             logger.error(f"Error with bucket: {str(e)}")
             raise
 
+    def _get_documents(self) -> List[dict]:
+        manifest = self.blob_store.manifest()
+        # Chaque contenu n'est téléchargé qu'une fois, même publié sous plusieurs noms
+        contents = self.blob_store.get_many(entry["sha256"] for entry in manifest.values())
+        documents = []
+        for name, entry in manifest.items():
+            if entry["sha256"] not in contents:
+                continue
+            try:
+                documents.append({
+                    'name': name,
+                    'sha256': entry["sha256"],
+                    'content': contents[entry["sha256"]].decode('utf-8')
+                })
+            except Exception as e:
+                logger.error(f"Error reading {name}: {str(e)}")
+        # Objets déposés sous leur nom avant le stockage par contenu
+        legacy = self.blob_store.read_objects(self.blob_store.legacy_names(manifest))
+        for name, content in legacy.items():
+            try:
+                documents.append({
+                    'name': name,
+                    'sha256': hashlib.sha256(content).hexdigest(),
+                    'content': content.decode('utf-8')
+                })
+            except Exception as e:
+                logger.error(f"Error reading {name}: {str(e)}")
+        return documents
+
     async def get_documents(self) -> List[dict]:
         try:
-            documents = []
-            objects = self.client.list_objects(self.bucket_name)
-            
-            for obj in objects:
-                try:
-                    data = self.client.get_object(
-                        self.bucket_name,
-                        obj.object_name
-                    )
-                    content = data.read().decode('utf-8')
-                    documents.append({
-                        'name': obj.object_name,
-                        'content': content
-                    })
-                except Exception as e:
-                    logger.error(f"Error reading {obj.object_name}: {str(e)}")
-                finally:
-                    if 'data' in locals():
-                        data.close()
-                        data.release_conn()
-            
-            return documents
+            # Les téléchargements bloquants se font dans le pool du fetcher, hors de la boucle asyncio
+            return await asyncio.to_thread(self._get_documents)
         except Exception as e:
             logger.error(f"Error fetching documents: {str(e)}")
             return []
 
     def upload_document(self, file_name: str, content: str) -> bool:
         try:
-            content_bytes = content.encode('utf-8')
-            content_stream = io.BytesIO(content_bytes)
-            self.client.put_object(
-                self.bucket_name,
-                file_name,
-                content_stream,
-                len(content_bytes),
-                content_type='text/plain'
-            )
-            logger.info(f"Uploaded {file_name}")
+            _, duplicate = self.blob_store.put_bytes(file_name, content.encode('utf-8'))
+            logger.info(f"Uploaded {file_name}" + (" (contenu déjà présent)" if duplicate else ""))
             return True
         except Exception as e:
             logger.error(f"Upload error: {str(e)}")
             return False
 
 class DocumentLoader:
-    def __init__(self):
+    def __init__(self, extraction_cache: ExtractionCache = None):
         self.storage = os.path.join(os.getcwd(), "documents")
         os.makedirs(self.storage, exist_ok=True)
+        # Contenu stocké par sha256, les noms ne sont que des entrées du manifeste
+        self.blob_store = LocalBlobStore(self.storage)
+        self.upload_dir = os.path.join(self.storage, ".uploads")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.extraction_cache = extraction_cache or ExtractionCache()
+        # Empreintes des fichiers déposés directement dans documents/ : nom -> (taille, mtime, sha256)
+        self._legacy_hashes: Dict[str, Tuple[int, int, str]] = {}
 
     async def upload_document(self, file: UploadFile) -> dict:
-        """Upload un document et retourne ses informations"""
+        """Upload un document par morceaux, en calculant son empreinte sha256 au passage"""
+        tmp_path = os.path.join(self.upload_dir, f"{uuid.uuid4()}.part")
         try:
-            file_path = os.path.join(self.storage, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp_path, "wb") as buffer:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(buffer.write, chunk)
+            # Le nom ne pointe vers le contenu qu'une fois le blob complet ;
+            # un contenu déjà connu n'est pas stocké une seconde fois
+            sha256 = digest.hexdigest()
+            duplicate = await asyncio.to_thread(self.blob_store.commit_file, file.filename, tmp_path, sha256)
             
             return {
                 "name": file.filename,
-                "size": os.path.getsize(file_path)
+                "size": size,
+                "sha256": sha256,
+                "duplicate": duplicate
             }
         except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             print(f"Error uploading {file.filename}: {str(e)}")
             raise e
 
+    def _legacy_path(self, filename: str) -> str:
+        return os.path.join(self.storage, os.path.basename(filename))
+
+    def resolve_path(self, filename: str) -> Optional[str]:
+        """Chemin du contenu publié sous ce nom (blob, ou fichier déposé directement dans documents/)"""
+        sha256 = self.blob_store.resolve(filename)
+        if sha256 is not None:
+            return self.blob_store.blob_path(sha256)
+        file_path = self._legacy_path(filename)
+        return file_path if os.path.isfile(file_path) else None
+
+    def content_hash(self, filename: str) -> Optional[str]:
+        """sha256 du contenu publié sous ce nom, ou None si le document n'existe pas"""
+        sha256 = self.blob_store.resolve(filename)
+        if sha256 is not None:
+            return sha256
+        file_path = self._legacy_path(filename)
+        if not os.path.isfile(file_path):
+            return None
+        stat = os.stat(file_path)
+        cached = self._legacy_hashes.get(filename)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        sha256 = sha256_file(file_path)
+        self._legacy_hashes[filename] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return sha256
+
     async def list_documents(self) -> List[dict]:
         """Liste tous les documents disponibles"""
         try:
-            documents = []
+            manifest = self.blob_store.manifest()
+            documents = [
+                {"name": name, "size": entry["size"], "sha256": entry["sha256"]}
+                for name, entry in manifest.items()
+            ]
             for filename in os.listdir(self.storage):
+                if filename in manifest:
+                    continue
                 if filename.lower().endswith(('.txt', '.pdf', '.doc', '.docx')):
                     file_path = os.path.join(self.storage, filename)
                     documents.append({
@@ -114,50 +183,74 @@ class DocumentLoader:
             print(f"Error listing documents: {str(e)}")
             raise e
 
-    async def load_documents(self, filenames: List[str]) -> List[Document]:
-        documents = []
-        for filename in filenames:
-            file_path = os.path.join(self.storage, filename)
-            logger.info(f"Tentative de lecture du fichier: {file_path}")
-            
-            if not os.path.exists(file_path):
-                logger.warning(f"Fichier non trouvé: {file_path}")
-                continue
+    async def delete_document(self, filename: str) -> bool:
+        """Supprime un document ; son blob n'est effacé que si aucun autre nom ne le référence"""
+        if self.blob_store.resolve(filename) is not None:
+            await asyncio.to_thread(self.blob_store.remove, filename)
+            return True
+        file_path = self._legacy_path(filename)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+            self._legacy_hashes.pop(filename, None)
+            return True
+        return False
 
-            try:
-                if filename.lower().endswith('.pdf'):
-                    # Essayer avec pdfplumber
-                    with pdfplumber.open(file_path) as pdf:
-                        text = ""
-                        for page in pdf.pages:
-                            page_text = page.extract_text()
-                            if page_text:
-                                text += page_text + "\n"
-                        
-                        if text.strip():
-                            logger.info(f"Contenu extrait du PDF: {text[:100]}...")  # Log des premiers caractères
-                            documents.append(Document(
-                                page_content=text,
-                                metadata={
-                                    "source": filename,
-                                    "type": "pdf"
-                                }
-                            ))
-                            logger.info(f"PDF chargé avec succès: {filename}")
-                        else:
-                            # Si pdfplumber échoue, essayer PyPDFLoader
-                            logger.info("Tentative avec PyPDFLoader...")
-                            loader = PyPDFLoader(file_path)
-                            pdf_docs = loader.load()
-                            if pdf_docs:
-                                documents.extend(pdf_docs)
-                                logger.info(f"PDF chargé avec PyPDFLoader: {filename}")
-                            else:
-                                logger.warning(f"PDF illisible avec les deux méthodes: {filename}")
-                
-            except Exception as e:
-                logger.error(f"Erreur lors du chargement de {filename}: {str(e)}")
-                logger.exception(e)  # Log complet de l'erreur
+    async def _extract_pdf(self, filename: str, file_path: str, sha256: str):
+        """Retourne (texte, début de chaque page), depuis le cache si ce contenu a déjà été extrait"""
+        key = sha256
+        cached = self.extraction_cache.get(key)
+        if cached is not None:
+            logger.info(f"Texte extrait lu depuis le cache: {filename}")
+            return cached
+
+        text = ""
+        page_offsets = []
+        with timed("extraction"):
+            pages = await extract_pdf_pages(file_path)
+        for page_text in pages:
+            page_offsets.append(len(text))
+            if page_text:
+                text += page_text + "\n"
+
+        if text.strip():
+            self.extraction_cache.put(key, text, page_offsets)
+        return text, page_offsets
 
+    async def _load_document(self, filename: str) -> List[Document]:
+        file_path = self.resolve_path(filename)
+        logger.info(f"Tentative de lecture du fichier: {filename} ({file_path})")
+
+        if file_path is None:
+            logger.warning(f"Fichier non trouvé: {filename}")
+            return []
+
+        try:
+            if filename.lower().endswith('.pdf'):
+                sha256 = await asyncio.to_thread(self.content_hash, filename)
+                text, page_offsets = await self._extract_pdf(filename, file_path, sha256)
+
+                if text.strip():
+                    logger.info(f"Contenu extrait du PDF: {text[:100]}...")  # Log des premiers caractères
+                    logger.info(f"PDF chargé avec succès: {filename}")
+                    return [Document(
+                        page_content=text,
+                        metadata={
+                            "source": filename,
+                            "content_hash": sha256,
+                            "type": "pdf",
+                            "page_count": len(page_offsets)
+                        }
+                    )]
+                logger.warning(f"PDF illisible avec les deux méthodes: {filename}")
+
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement de {filename}: {str(e)}")
+            logger.exception(e)  # Log complet de l'erreur
+        return []
+
+    async def load_documents(self, filenames: List[str]) -> List[Document]:
+        # Les fichiers sont extraits en parallèle, l'ordre des résultats est conservé
+        results = await asyncio.gather(*(self._load_document(filename) for filename in filenames))
+        documents = [doc for docs in results for doc in docs]
         logger.info(f"Nombre total de documents chargés: {len(documents)}")
         return documents
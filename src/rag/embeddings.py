@@ -1,11 +1,259 @@
-from langchain_ollama import OllamaEmbeddings
-from src.config import OLLAMA_CONFIG
+from langchain_core.embeddings import Embeddings
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import PRIORITY_INTERACTIVE
+from src.metrics import timed
+from src.config import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY
+)
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Cache disque des embeddings (SQLite, vecteurs float32) avec éviction LRU"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        """Retourne {clé: vecteur} pour les clés présentes et rafraîchit leur date d'accès"""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite limite le nombre de paramètres par requête
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: dict) -> None:
+        """Enregistre {clé: vecteur} puis évince les entrées les moins récemment utilisées"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            # On libère 10% de marge pour ne pas évincer à chaque insertion
+            excess += self.max_entries // 10
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            logger.info(f"Cache d'embeddings: {excess} entrées évincées")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+class OllamaClientEmbeddings(Embeddings):
+    """Interface Embeddings de LangChain au-dessus du client Ollama partagé"""
+
+    def __init__(self, client: OllamaClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_sync(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.client.embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_sync([text], priority=PRIORITY_INTERACTIVE)[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Une requête utilisateur passe devant les lots d'ingestion
+        return (await self.client.embed([text], priority=PRIORITY_INTERACTIVE))[0]
+
+class CachedEmbeddings(Embeddings):
+    """Enveloppe un objet Embeddings et met en cache ses vecteurs par hash du texte et du modèle"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def _lookup(self, texts: List[str]):
+        keys = [self.cache.make_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+        logger.debug(f"Embeddings: {len(texts) - len(missing)} depuis le cache, {len(missing)} calculés")
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.cache.make_key(self.model_name, text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        with timed("query_embedding"):
+            vector = await self.embeddings.aembed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+class EmbeddingEngine:
+    """Calcule des embeddings par lots avec une concurrence bornée et un suivi de progression.
+
+    Les erreurs transitoires sont reprises par OllamaClient : pas de seconde couche de reprises ici.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def _embed_batch(self, semaphore: asyncio.Semaphore, offset: int, texts: List[str]):
+        async with semaphore:
+            try:
+                with timed("embedding"):
+                    return offset, await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                logger.error(f"Échec de l'embedding du lot {offset}: {str(e)}")
+                raise
+
+    async def embed_stream(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> AsyncIterator[Tuple[int, List[List[float]]]]:
+        """Produit (offset, vecteurs) pour chaque lot dès qu'il est calculé, dans l'ordre d'achèvement"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.create_task(self._embed_batch(semaphore, start, texts[start:start + self.batch_size]))
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        done = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                offset, vectors = await next_done
+                done += len(vectors)
+                if progress:
+                    progress(done, len(texts))
+                else:
+                    logger.info(f"Embeddings calculés: {done}/{len(texts)}")
+                yield offset, vectors
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Variante bloquante : mêmes lots et même concurrence bornée, vecteurs dans l'ordre des textes"""
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        vectors: List[List[float]] = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embedding") as executor:
+            for offset, batch_vectors in zip(
+                range(0, len(texts), self.batch_size),
+                executor.map(self._embed_batch_sync, batches)
+            ):
+                vectors.extend(batch_vectors)
+                logger.info(f"Embeddings calculés: {offset + len(batch_vectors)}/{len(texts)}")
+        return vectors
+
+    def _embed_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        try:
+            with timed("embedding"):
+                return self.embeddings.embed_documents(texts)
+        except Exception as e:
+            logger.error(f"Échec de l'embedding d'un lot de {len(texts)} textes: {str(e)}")
+            raise
 
 class EmbeddingManager:
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(
-            base_url=OLLAMA_CONFIG["base_url"],
-            model=OLLAMA_CONFIG["model_name"]
+    def __init__(self, client: Optional[OllamaClient] = None, cache: Optional[EmbeddingCache] = None):
+        self.client = client or OllamaClient()
+        self.model_name = self.client.embedding_model
+        self.base_embeddings = OllamaClientEmbeddings(self.client)
+        self.embeddings = CachedEmbeddings(
+            self.base_embeddings,
+            self.model_name,
+            cache or EmbeddingCache()
         )
 
     def get_embeddings(self):
@@ -0,0 +1,76 @@
+from src.config import EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_BYTES
+from typing import List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExtractionCache:
+    """Cache disque du texte extrait des PDF, avec les limites de pages, évincé en LRU par taille totale"""
+
+    def __init__(self, path: str = EXTRACTION_CACHE_PATH, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, "
+            "page_offsets TEXT NOT NULL, size_bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extractions_access ON extractions(last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, List[int]]]:
+        """Retourne (texte, début de chaque page) ou None ; la clé est le sha256 du contenu"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, page_offsets FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, text: str, page_offsets: List[int]) -> None:
+        size_bytes = len(text.encode('utf-8'))
+        if size_bytes > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions "
+                "(key, text, page_offsets, size_bytes, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, text, json.dumps(page_offsets), size_bytes, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM extractions"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size_bytes FROM extractions ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size_bytes in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size_bytes
+        self._conn.executemany("DELETE FROM extractions WHERE key = ?", evicted)
+        logger.info(f"Cache d'extraction: {len(evicted)} entrées évincées")
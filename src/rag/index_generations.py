@@ -0,0 +1,118 @@
+from typing import List, Optional
+from src.config import VECTOR_STORE_GENERATIONS_KEEP
+import fcntl
+import os
+import shutil
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Disposition sous VECTOR_STORE_PATH :
+#   CURRENT                  nom de la génération servie, remplacé atomiquement
+#   generations/00000042/    génération publiée, jamais modifiée ensuite
+#   generations/.staging-*/  génération en cours d'écriture
+#   write.lock               verrou des écrivains (workers, CLI)
+CURRENT_FILENAME = "CURRENT"
+GENERATIONS_DIRNAME = "generations"
+LOCK_FILENAME = "write.lock"
+STAGING_PREFIX = ".staging-"
+
+class WriterLock:
+    """Verrou fichier exclusif entre processus ; acquire() bloque, à appeler hors de la boucle d'événements"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, "a")
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        self._file = f
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "WriterLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+class GenerationStore:
+    """Générations immuables de l'index ; un écrivain prépare un dossier puis le publie d'un rename"""
+
+    def __init__(self, root: str, keep: int = VECTOR_STORE_GENERATIONS_KEEP):
+        self.root = root
+        self.keep = max(1, keep)
+        self.generations_dir = os.path.join(root, GENERATIONS_DIRNAME)
+        self.lock = WriterLock(os.path.join(root, LOCK_FILENAME))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.generations_dir, name)
+
+    def current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def published(self) -> List[str]:
+        if not os.path.isdir(self.generations_dir):
+            return []
+        return sorted(name for name in os.listdir(self.generations_dir) if name.isdigit())
+
+    def new_staging(self) -> str:
+        path = self.path(STAGING_PREFIX + uuid.uuid4().hex)
+        os.makedirs(path)
+        return path
+
+    def link_files(self, name: str, staging_path: str, filenames) -> None:
+        """Reprend des fichiers d'une génération publiée dans un dossier de travail, par lien physique
+        (les générations ne sont jamais modifiées), ou par copie si le système de fichiers ne le permet pas"""
+        for filename in filenames:
+            source = os.path.join(self.path(name), filename)
+            target = os.path.join(staging_path, filename)
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+
+    def publish(self, staging_path: str) -> str:
+        """Renomme le dossier de travail en nouvelle génération puis bascule CURRENT ; sous le verrou d'écriture"""
+        published = self.published()
+        name = f"{int(published[-1]) + 1 if published else 1:08d}"
+        os.rename(staging_path, self.path(name))
+        tmp_path = os.path.join(self.root, CURRENT_FILENAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILENAME))
+        self.collect(name)
+        return name
+
+    def discard(self, staging_path: str) -> None:
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    def collect(self, current: str) -> None:
+        """Supprime les générations au-delà des `keep` plus récentes et les dossiers de travail abandonnés.
+
+        Un worker encore sur une ancienne génération continue de la lire : ses fichiers ouverts
+        ou mappés restent valides jusqu'à ce qu'il bascule.
+        """
+        published = self.published()
+        for name in published[:-self.keep]:
+            if name != current:
+                shutil.rmtree(self.path(name), ignore_errors=True)
+        for name in os.listdir(self.generations_dir):
+            if name.startswith(STAGING_PREFIX):
+                # Seul le détenteur du verrou écrit : les autres dossiers viennent d'écritures interrompues
+                shutil.rmtree(self.path(name), ignore_errors=True)
@@ -0,0 +1,76 @@
+"""Outils de l'index vectoriel : python -m src.rag.index_tool {info,rebuild,evaluate}"""
+import argparse
+import asyncio
+import json
+import logging
+import numpy as np
+from src.llm.ollama_client import OllamaClient
+from src.rag.ann_index import evaluate_specs, index_memory_bytes
+from src.rag.embeddings import EmbeddingManager
+from src.rag.vector_store import VectorStore
+
+def info(vector_store: VectorStore) -> dict:
+    index = vector_store.vector_store.index
+    return {
+        "generation": vector_store.generation,
+        "spec": vector_store.built_spec,
+        "target_spec": vector_store.target_spec,
+        "vectors": int(index.ntotal),
+        "tombstones": len(vector_store.tombstones),
+        "memory_bytes": index_memory_bytes(index)
+    }
+
+def rebuild(vector_store: VectorStore, spec: str) -> dict:
+    with vector_store.writing():
+        vector_store.rebuild(spec)
+        vector_store.save()
+    return info(vector_store)
+
+def evaluate(vector_store: VectorStore, specs: list, k: int, queries: int, query_file: str = None) -> list:
+    _, vectors = vector_store.stored_vectors()
+    if query_file:
+        # Requêtes réelles, une par ligne
+        with open(query_file, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        query_vectors = np.asarray([vector_store.embeddings.embed_query(text) for text in texts], dtype=np.float32)
+    else:
+        # À défaut, des vecteurs de l'index légèrement bruités
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(queries, len(vectors)), replace=False)]
+        query_vectors = sample + rng.normal(0, 0.01 * float(np.std(vectors)), sample.shape).astype(np.float32)
+    return evaluate_specs(specs, vectors, query_vectors, k=k)
+
+async def run(args: argparse.Namespace):
+    ollama_client = OllamaClient()
+    try:
+        embedding_manager = EmbeddingManager(ollama_client)
+        vector_store = VectorStore(embedding_manager.get_embeddings())
+        if vector_store.vector_store is None:
+            raise SystemExit("Aucun index persisté")
+        if args.command == "info":
+            return info(vector_store)
+        if args.command == "rebuild":
+            return await asyncio.to_thread(rebuild, vector_store, args.spec or vector_store.index_spec)
+        return await asyncio.to_thread(evaluate, vector_store, args.specs, args.k, args.queries, args.query_file)
+    finally:
+        await ollama_client.aclose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspecte, reconstruit ou évalue l'index FAISS")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="spec, taille et mémoire de l'index")
+    rebuild_parser = subparsers.add_parser("rebuild", help="reconstruit et entraîne l'index")
+    rebuild_parser.add_argument("--spec", help="spec faiss.index_factory (défaut : VECTOR_INDEX_SPEC)")
+    evaluate_parser = subparsers.add_parser("evaluate", help="recall@k et latence de plusieurs specs")
+    evaluate_parser.add_argument("--specs", nargs="+", default=["Flat", "HNSW32", "IVF1024,Flat", "IVF1024,PQ16", "SQ8"])
+    evaluate_parser.add_argument("--k", type=int, default=10)
+    evaluate_parser.add_argument("--queries", type=int, default=1000, help="nombre de requêtes tirées de l'index")
+    evaluate_parser.add_argument("--query-file", help="fichier de requêtes texte, une par ligne")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
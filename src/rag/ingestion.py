@@ -0,0 +1,309 @@
+from langchain_core.documents import Document
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, INGESTION_BATCH_FILES, PDF_EXTRACTION_WORKERS, RETRIEVAL_TOP_K
+from src.rag.document_loader import DocumentLoader
+from src.rag.response_cache import ResponseCache, sources_of
+from src.rag.pdf_extraction import get_executor
+from src.metrics import timed
+import asyncio
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Appelée avec le nom de l'étape (extract, analyze, chunk, embed, index, cleanup) et ses détails
+StageCallback = Callable[[str, Dict], None]
+
+class DocumentIngestor:
+    """Découpe les documents, les indexe dans le VectorStore et retrouve les chunks pertinents"""
+
+    def __init__(
+        self,
+        vector_store,
+        document_loader: Optional[DocumentLoader] = None,
+        response_cache: Optional[ResponseCache] = None
+    ):
+        self.vector_store = vector_store
+        self.document_loader = document_loader or DocumentLoader()
+        self.response_cache = response_cache
+        # Import différé : le paquet langchain n'est chargé qu'à la création de l'ingesteur
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP
+        )
+        self._lock = asyncio.Lock()
+        # Sources dont les réponses en cache sont à invalider à la publication de l'écriture en cours
+        self._stale_sources = set()
+        # nom -> hash du contenu indexé pour ce nom, et hash -> ids de ses chunks
+        self._documents: Dict[str, str] = {}
+        self._contents: Dict[str, List[str]] = {}
+        # Génération dont viennent _documents et _contents
+        self._generation: Optional[str] = None
+        self._load_manifest()
+
+    def _load_manifest(self) -> None:
+        """Charge les documents indexés et les chunks de chaque contenu depuis la génération servie,
+        qui publie le manifeste avec l'index qu'il décrit"""
+        manifest = self.vector_store.manifest
+        self._generation = self.vector_store.generation
+        if manifest is not None:
+            self._documents = dict(manifest["documents"])
+            self._contents = dict(manifest["contents"])
+            return
+        self._documents = {}
+        self._contents = {}
+        if self.vector_store.vector_store is not None:
+            # Index écrit hors de l'ingesteur (scripts) : les chunks sont retrouvés depuis le docstore
+            logger.info("Reconstruction du manifeste d'ingestion depuis le docstore")
+            self._contents = self.vector_store.chunk_ids_by_content()
+
+    def _manifest(self) -> Dict:
+        return {"documents": self._documents, "contents": self._contents}
+
+    def _refresh_manifest(self) -> None:
+        """Suit, sans verrou, la génération publiée par un autre processus et son manifeste.
+        Pas pendant une écriture de ce processus, qui tient le manifeste à jour elle-même"""
+        if self._lock.locked():
+            return
+        self.vector_store.refresh()
+        if self.vector_store.generation != self._generation:
+            self._load_manifest()
+
+    def _is_indexed(self, filename: str, content_hash: str) -> bool:
+        return self._documents.get(filename) == content_hash and content_hash in self._contents
+
+    def split_documents(self, documents: List[Document], filename: str, content_hash: Optional[str] = None) -> List[Document]:
+        """Découpe les documents en chunks de CHUNK_SIZE avec CHUNK_OVERLAP"""
+        date_added = datetime.now().isoformat()
+        chunks = self.splitter.split_documents(documents)
+        for i, chunk in enumerate(chunks):
+            chunk.metadata.update({
+                "source": filename,
+                "filename": filename,
+                "content_hash": content_hash,
+                "chunk_id": str(uuid.uuid4()),
+                "chunk_index": i,
+                "date_added": date_added
+            })
+        return chunks
+
+    def analyze_documents(self, documents: List[Document]) -> None:
+        """Ajoute à chaque document ses statistiques, tags et complexité ; bloquant, à lancer dans un thread.
+
+        L'analyse est répartie sur le pool de l'extraction PDF, dont les workers gardent NLTK chargé.
+        """
+        analyses = self.vector_store.analyzer.analyze_batch(
+            [doc.page_content for doc in documents], PDF_EXTRACTION_WORKERS, get_executor()
+        )
+        for doc, analysis in zip(documents, analyses):
+            doc.metadata.update(analysis.to_dict())
+
+    async def _ingest_files(self, filenames: List[str], on_stage: Optional[StageCallback] = None) -> Dict[str, Optional[int]]:
+        """Extrait, analyse, découpe, embedde et indexe des fichiers ; nombre de chunks par fichier, ou None.
+
+        Les fichiers sont traités par groupes de INGESTION_BATCH_FILES : l'analyse de tous les documents
+        d'un groupe part en un seul lot sur le pool de processus.
+        """
+        def report(stage: str, **details) -> None:
+            if on_stage:
+                on_stage(stage, details)
+
+        results: Dict[str, Optional[int]] = {}
+        # Une seule passe de hachage : un contenu déjà indexé, sous ce nom ou un autre, n'est pas retraité
+        hashes = await asyncio.to_thread(lambda: [self.document_loader.content_hash(name) for name in filenames])
+        pending = []
+        # Fichiers dont le contenu est indexé par un autre fichier de l'appel
+        aliases = []
+        for filename, content_hash in zip(filenames, hashes):
+            if content_hash is None:
+                logger.warning(f"Fichier non trouvé pour l'ingestion: {filename}")
+                results[filename] = None
+            elif content_hash in self._contents:
+                if self._documents.get(filename) != content_hash:
+                    self._stale_sources.add(filename)
+                self._documents[filename] = content_hash
+                results[filename] = 0
+            elif any(content_hash == pending_hash for _, pending_hash in pending):
+                aliases.append((filename, content_hash))
+            else:
+                pending.append((filename, content_hash))
+
+        batch_files = max(1, INGESTION_BATCH_FILES)
+        for start in range(0, len(pending), batch_files):
+            loaded = []
+            for filename, content_hash in pending[start:start + batch_files]:
+                report("extract", filename=filename)
+                loaded.append((filename, content_hash, await self.document_loader.load_documents([filename])))
+
+            report("analyze", files=len(loaded))
+            with timed("analysis"):
+                await asyncio.to_thread(
+                    self.analyze_documents, [doc for _, _, documents in loaded for doc in documents]
+                )
+
+            for filename, content_hash, documents in loaded:
+                report("chunk", filename=filename)
+                chunks = self.split_documents(documents, filename, content_hash)
+                if not chunks:
+                    logger.warning(f"Aucun contenu indexable pour {filename}")
+                    results[filename] = None
+                    continue
+
+                report("embed", filename=filename, done=0, total=len(chunks))
+                await self.vector_store.aadd_documents(
+                    chunks, progress=lambda done, total: report("embed", filename=filename, done=done, total=total)
+                )
+
+                report("index", filename=filename)
+                # Les réponses construites sur l'ancienne version du document ne sont plus valides
+                self._stale_sources.add(filename)
+                self._documents[filename] = content_hash
+                self._contents[content_hash] = [chunk.metadata["chunk_id"] for chunk in chunks]
+                logger.info(f"{filename} indexé en {len(chunks)} chunks")
+                results[filename] = len(chunks)
+
+        for filename, content_hash in aliases:
+            if content_hash in self._contents:
+                self._stale_sources.add(filename)
+                self._documents[filename] = content_hash
+                results[filename] = 0
+            else:
+                results[filename] = None
+        return results
+
+    @asynccontextmanager
+    async def _writing(self):
+        """Verrou du processus puis verrou d'écriture partagé avec les autres workers et les CLI.
+
+        Le manifeste est relu : un autre processus a pu indexer depuis le dernier chargement.
+        Toutes les modifications de l'opération vont dans un seul brouillon, publié une fois à la sortie ;
+        si l'opération échoue, le brouillon est abandonné et le manifeste rechargé.
+        """
+        async with self._lock:
+            await asyncio.to_thread(self.vector_store.lock_for_write)
+            self._stale_sources = set()
+            try:
+                self._load_manifest()
+                try:
+                    yield
+                except BaseException:
+                    await asyncio.to_thread(self.vector_store.discard_changes)
+                    self._load_manifest()
+                    raise
+                await asyncio.to_thread(self.vector_store.save, self._manifest())
+                self._load_manifest()
+                if self.response_cache is not None and self._stale_sources:
+                    self.response_cache.invalidate_sources(self._stale_sources)
+            finally:
+                await asyncio.to_thread(self.vector_store.unlock_for_write)
+
+    async def ingest_file(self, filename: str, on_stage: Optional[StageCallback] = None) -> Optional[int]:
+        async with self._writing():
+            return (await self._ingest_files([filename], on_stage))[filename]
+
+    async def ingest(self, filenames: List[str]) -> List[str]:
+        """Indexe les fichiers absents ou modifiés et retourne les fichiers disponibles.
+
+        Appelée à chaque chat RAG : quand tout est déjà indexé, la réponse vient du manifeste sans
+        prendre de verrou ; seul un fichier à indexer prend le verrou d'écriture, et est revérifié dessous.
+        """
+        hashes = await asyncio.to_thread(lambda: [self.document_loader.content_hash(name) for name in filenames])
+        self._refresh_manifest()
+        if all(content_hash is None or self._is_indexed(filename, content_hash)
+               for filename, content_hash in zip(filenames, hashes)):
+            return [filename for filename, content_hash in zip(filenames, hashes) if content_hash is not None]
+
+        async with self._writing():
+            results = await self._ingest_files(filenames)
+            return [filename for filename in filenames if results[filename] is not None]
+
+    async def _collect_garbage(self) -> int:
+        """Supprime de l'index les contenus qui ne sont plus désignés par aucun document"""
+        referenced = set(self._documents.values())
+        stale = [content_hash for content_hash in self._contents if content_hash not in referenced]
+        chunk_ids = [chunk_id for content_hash in stale for chunk_id in self._contents[content_hash]]
+        if not chunk_ids:
+            for content_hash in stale:
+                del self._contents[content_hash]
+            return 0
+
+        deleted = await asyncio.to_thread(self.vector_store.delete, chunk_ids)
+        for content_hash in stale:
+            del self._contents[content_hash]
+        self._stale_sources.update(sources_of(deleted))
+        return len(deleted)
+
+    async def sync(self, on_stage: Optional[StageCallback] = None) -> Dict:
+        """Met l'index en phase avec le stockage : indexe les documents nouveaux ou modifiés,
+        retire ceux qui ont disparu ; le travail est proportionnel aux changements"""
+        async with self._writing():
+            names = [document["name"] for document in await self.document_loader.list_documents()]
+            current = {}
+            for name in names:
+                content_hash = await asyncio.to_thread(self.document_loader.content_hash, name)
+                if content_hash is not None:
+                    current[name] = content_hash
+
+            added = [name for name in current if name not in self._documents]
+            updated = [name for name in current if name in self._documents and self._documents[name] != current[name]]
+            removed = [name for name in self._documents if name not in current]
+
+            failed = []
+            results = await self._ingest_files(added + updated, on_stage)
+            for name in added + updated:
+                if results[name] is None:
+                    failed.append(name)
+                    # Un document illisible ne garde pas l'ancienne version de son contenu
+                    self._documents.pop(name, None)
+            for name in removed:
+                del self._documents[name]
+                self._stale_sources.add(name)
+
+            if on_stage:
+                on_stage("cleanup", {})
+            deleted_chunks = await self._collect_garbage()
+
+            result = {
+                "added": added,
+                "updated": updated,
+                "removed": removed,
+                "failed": failed,
+                "unchanged": len(current) - len(added) - len(updated),
+                "deleted_chunks": deleted_chunks
+            }
+            logger.info(f"Synchronisation de l'index: {result}")
+            return result
+
+    async def remove_document(self, filename: str) -> int:
+        """Retire un document de l'index ; son contenu est supprimé s'il n'est plus référencé"""
+        async with self._writing():
+            if self._documents.pop(filename, None) is not None:
+                self._stale_sources.add(filename)
+            deleted_chunks = await self._collect_garbage()
+            return deleted_chunks
+
+    def retrieve(self, query: str, filenames: List[str], k: int = RETRIEVAL_TOP_K) -> List[Document]:
+        """Retourne les k chunks les plus proches de la requête parmi les fichiers donnés"""
+        # Les chunks sont rattachés au contenu : on filtre sur les hash que désignent ces noms
+        names: Dict[str, str] = {}
+        for filename, content_hash in zip(filenames, map(self.document_loader.content_hash, filenames)):
+            if content_hash is not None:
+                names.setdefault(content_hash, filename)
+        if not names:
+            return []
+        docs = self.vector_store.hybrid_search(
+            query,
+            k=k,
+            filter={"content_hash": list(names)},
+            fetch_k=max(20, k * 5)
+        )
+        # Un contenu partagé par plusieurs noms garde les métadonnées de son premier envoi :
+        # la source citée est le nom sous lequel il est demandé
+        resolved = []
+        for doc in docs:
+            name = names[doc.metadata["content_hash"]]
+            resolved.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "source": name, "filename": name}))
+        return resolved
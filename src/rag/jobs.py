@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.config import INGESTION_WORKERS, INGESTION_JOB_HISTORY
+from src.rag.ingestion import DocumentIngestor
+from src.logging_context import request_id_var
+import asyncio
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class IngestionJob:
+    filename: str
+    sha256: Optional[str] = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued, running, done, failed
+    stage: Optional[str] = None
+    progress: Dict = field(default_factory=dict)
+    chunks: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    # Requête HTTP d'origine : les logs de l'ingestion portent le même identifiant
+    request_id: str = field(default_factory=request_id_var.get)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+class IngestionJobQueue:
+    """File des ingestions lancées après un upload, traitées par des workers asyncio"""
+
+    def __init__(
+        self,
+        ingestor: DocumentIngestor,
+        workers: int = INGESTION_WORKERS,
+        history: int = INGESTION_JOB_HISTORY
+    ):
+        self.ingestor = ingestor
+        self.workers = workers
+        self.history = history
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, filename: str, sha256: Optional[str] = None) -> IngestionJob:
+        job = IngestionJob(filename=filename, sha256=sha256)
+        self._jobs[job.id] = job
+        # On ne garde que l'historique récent des jobs terminés
+        while len(self._jobs) > self.history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        return list(reversed(self._jobs.values()))
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            token = request_id_var.set(job.request_id)
+            try:
+                await self._run(job)
+            finally:
+                request_id_var.reset(token)
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob) -> None:
+        job.status = "running"
+        job.started_at = datetime.now().isoformat()
+
+        def on_stage(stage: str, details: Dict) -> None:
+            job.stage = stage
+            job.progress = details
+
+        try:
+            chunks = await self.ingestor.ingest_file(job.filename, on_stage)
+            if chunks is None:
+                raise ValueError(f"Aucun contenu indexable pour {job.filename}")
+            job.chunks = chunks
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Échec de l'ingestion de {job.filename}: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now().isoformat()
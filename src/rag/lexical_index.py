@@ -0,0 +1,96 @@
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import math
+import os
+import pickle
+
+class BM25Index:
+    """Index inversé BM25 des chunks, construit à l'ingestion"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # terme -> {id du chunk: fréquence du terme}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        # id du chunk -> termes distincts, pour retirer un chunk sans parcourir tout le vocabulaire
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id: str, terms: List[str]) -> None:
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_terms[doc_id] = list(counts)
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, doc_id: str) -> None:
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id, []):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(
+        self,
+        terms: List[str],
+        k: int,
+        allowed: Optional[Callable[[str], bool]] = None
+    ) -> List[Tuple[str, float]]:
+        """Retourne les k meilleurs (id, score) pour les termes de la requête"""
+        if not self.doc_lengths:
+            return []
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs if n_docs else 0
+        scores: Dict[str, float] = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        candidates = scores.items()
+        if allowed is not None:
+            candidates = [(doc_id, score) for doc_id, score in candidates if allowed(doc_id)]
+        return heapq.nlargest(k, candidates, key=lambda item: item[1])
+
+    def copy(self) -> "BM25Index":
+        """Copie indépendante, modifiable sans toucher à l'index servi aux recherches"""
+        return pickle.loads(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                (self.k1, self.b, self.postings, self.doc_lengths, self.doc_terms, self.total_length), f
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "rb") as f:
+            k1, b, postings, doc_lengths, doc_terms, total_length = pickle.load(f)
+        index = cls(k1=k1, b=b)
+        index.postings = postings
+        index.doc_lengths = doc_lengths
+        index.doc_terms = doc_terms
+        index.total_length = total_length
+        return index
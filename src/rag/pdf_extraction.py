@@ -0,0 +1,92 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from src.config import PDF_EXTRACTION_WORKERS, PDF_PAGES_PER_TASK, PDF_PAGE_TIMEOUT
+import asyncio
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+class PageTimeout(Exception):
+    pass
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+def _count_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+def _extract_page_range(file_path: str, start: int, end: int, page_timeout: float) -> List[str]:
+    """Extrait les pages [start, end) dans un processus de travail, avec un délai maximal par page"""
+    import pdfplumber
+
+    # Les tâches d'un ProcessPoolExecutor tournent dans le thread principal du worker
+    use_alarm = hasattr(signal, "SIGALRM") and page_timeout > 0
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout)
+
+    pages = []
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            for page_number in range(start, end):
+                try:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                    pages.append(pdf.pages[page_number].extract_text() or "")
+                except PageTimeout:
+                    logger.warning(f"Page {page_number} de {file_path} ignorée (délai dépassé)")
+                    pages.append("")
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous_handler)
+    return pages
+
+def _extract_with_pypdf(file_path: str) -> List[str]:
+    from langchain_community.document_loaders import PyPDFLoader
+    return [doc.page_content for doc in PyPDFLoader(file_path).load()]
+
+def get_executor() -> ProcessPoolExecutor:
+    """Pool de processus partagé, créé au premier usage"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PDF_EXTRACTION_WORKERS)
+    return _executor
+
+async def extract_pdf_pages(
+    file_path: str,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    page_timeout: float = PDF_PAGE_TIMEOUT
+) -> List[str]:
+    """Extrait le texte de chaque page en répartissant des plages de pages sur le pool, dans l'ordre"""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+
+    page_count = await loop.run_in_executor(executor, _count_pages, file_path)
+    ranges = [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+
+    async def run_range(start: int, end: int) -> List[str]:
+        future = loop.run_in_executor(executor, _extract_page_range, file_path, start, end, page_timeout)
+        # Filet de sécurité si le délai par page n'a pas pu interrompre le worker
+        try:
+            return await asyncio.wait_for(future, timeout=page_timeout * (end - start) + 5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Pages {start}-{end} de {file_path} abandonnées (délai dépassé)")
+            return [""] * (end - start)
+
+    results = await asyncio.gather(*(run_range(start, end) for start, end in ranges))
+    pages = [page for chunk in results for page in chunk]
+
+    if not any(page.strip() for page in pages):
+        # Si pdfplumber échoue, essayer PyPDFLoader
+        logger.info("Tentative avec PyPDFLoader...")
+        pages = await loop.run_in_executor(executor, _extract_with_pypdf, file_path)
+    return pages
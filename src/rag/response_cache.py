@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from src.config import RESPONSE_CACHE_CONFIG
+import json
+import threading
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedResponse:
+    query_vector: np.ndarray
+    chunk_ids: FrozenSet[str]
+    params_key: str
+    sources: FrozenSet[str]
+    response: str
+    created_at: float
+
+def make_params_key(model: str, options: Optional[Dict] = None) -> str:
+    return json.dumps({"model": model, **(options or {})}, sort_keys=True)
+
+def chunk_ids_of(docs: list) -> List[str]:
+    return [doc.metadata.get("chunk_id") or doc.page_content for doc in docs]
+
+def sources_of(docs: list) -> List[str]:
+    return [doc.metadata["source"] for doc in docs if doc.metadata.get("source")]
+
+def normalize(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+class ResponseCache:
+    """Cache sémantique des réponses : embedding de la requête proche, mêmes chunks, mêmes paramètres"""
+
+    def __init__(
+        self,
+        similarity_threshold: float = RESPONSE_CACHE_CONFIG["similarity_threshold"],
+        ttl: float = RESPONSE_CACHE_CONFIG["ttl"],
+        max_entries: int = RESPONSE_CACHE_CONFIG["max_entries"]
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        # (chunks, paramètres) -> ids des entrées, pour ne comparer que les candidats compatibles
+        self._buckets: Dict[Tuple[FrozenSet[str], str], List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket_key = (entry.chunk_ids, entry.params_key)
+        bucket = self._buckets.get(bucket_key, [])
+        if entry_id in bucket:
+            bucket.remove(entry_id)
+        if not bucket:
+            self._buckets.pop(bucket_key, None)
+
+    def lookup(
+        self,
+        query_vector: List[float],
+        chunk_ids: Iterable[str],
+        params_key: str,
+        sources: Optional[Iterable[str]] = None
+    ) -> Optional[str]:
+        """Retourne la réponse en cache la plus proche au-dessus du seuil de similarité.
+
+        sources : noms cités dans le prompt ; un même contenu demandé sous un autre nom ne réutilise
+        pas une réponse qui cite l'ancien.
+        """
+        query = normalize(query_vector)
+        now = time.time()
+        sources = frozenset(sources) if sources is not None else None
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in list(self._buckets.get((frozenset(chunk_ids), params_key), [])):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                if sources is not None and entry.sources != sources:
+                    continue
+                score = float(np.dot(query, entry.query_vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            logger.info(f"Réponse servie depuis le cache (similarité {best_score:.3f})")
+            return self._entries[best_id].response
+
+    def put(
+        self,
+        query_vector: List[float],
+        chunk_ids: Iterable[str],
+        params_key: str,
+        sources: Iterable[str],
+        response: str
+    ) -> None:
+        entry = CachedResponse(
+            query_vector=normalize(query_vector),
+            chunk_ids=frozenset(chunk_ids),
+            params_key=params_key,
+            sources=frozenset(sources),
+            response=response,
+            created_at=time.time()
+        )
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._buckets.setdefault((entry.chunk_ids, params_key), []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_sources(self, sources: Iterable[str]) -> None:
+        """Supprime les réponses construites à partir d'un des documents donnés"""
+        sources = set(sources)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.sources & sources]
+            for entry_id in stale:
+                self._remove(entry_id)
+        if stale:
+            logger.info(f"Cache de réponses: {len(stale)} entrées invalidées")
+
+    def clear(self) -> None:
+        """Vide le cache, par exemple quand un autre processus a publié un nouvel index"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
@@ -0,0 +1,45 @@
+"""Synchronisation incrémentale de l'index : python -m src.rag.sync"""
+import argparse
+import asyncio
+import json
+import logging
+from src.llm.ollama_client import OllamaClient
+from src.rag.embeddings import EmbeddingManager
+from src.rag.ingestion import DocumentIngestor
+from src.rag.vector_store import VectorStore
+
+def compact_index(vector_store: VectorStore) -> None:
+    with vector_store.writing():
+        vector_store.compact()
+        vector_store.save()
+
+async def run_sync(compact: bool = False) -> dict:
+    ollama_client = OllamaClient()
+    try:
+        embedding_manager = EmbeddingManager(ollama_client)
+        vector_store = VectorStore(embedding_manager.get_embeddings())
+        ingestor = DocumentIngestor(vector_store)
+
+        def on_stage(stage: str, details: dict) -> None:
+            logging.info(f"{stage} {details}")
+
+        result = await ingestor.sync(on_stage)
+        if compact and vector_store.tombstones:
+            # Compaction forcée, sans attendre le seuil VECTOR_STORE_COMPACTION_RATIO
+            await asyncio.to_thread(compact_index, vector_store)
+            result["compacted"] = True
+        return result
+    finally:
+        await ollama_client.aclose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Met l'index en phase avec le dossier documents/")
+    parser.add_argument("--compact", action="store_true", help="retire immédiatement les vecteurs supprimés")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(run_sync(compact=args.compact))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
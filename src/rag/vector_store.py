@@ -1,37 +1,679 @@
-from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
-from typing import List
+from langchain_core.documents import Document
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from contextlib import contextmanager
+from src.config import VECTOR_STORE_PATH, VECTOR_STORE_COMPACTION_RATIO, VECTOR_STORE_REFRESH_INTERVAL, VECTOR_INDEX_CONFIG
+from src.rag.ann_index import FLAT_SPEC, apply_search_params, build_index, faiss_module, min_training_vectors, needs_training
+from src.rag.embeddings import EmbeddingEngine
+from src.rag.document_analyzer import DocumentAnalyzer
+from src.rag.index_generations import GenerationStore
+from src.rag.lexical_index import BM25Index
+from src.metrics import timed
+import asyncio
+import json
+import os
+import uuid
+import threading
+import time
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite"
+LEXICAL_INDEX_FILENAME = "bm25.pkl"
+INDEX_META_FILENAME = "index_meta.json"
+# Manifeste de l'ingesteur (documents -> contenus -> chunks), publié avec l'index qu'il décrit
+MANIFEST_FILENAME = "ingested.json"
+INDEX_FILENAMES = (INDEX_FILENAME, DOCSTORE_FILENAME, LEXICAL_INDEX_FILENAME, INDEX_META_FILENAME)
+
+def _write_json(path: str, data) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def matches_filter(metadata: Dict, filter: Optional[Dict]) -> bool:
+    """Même sémantique que le filtre FAISS : valeur exacte ou appartenance à une liste"""
+    if not filter:
+        return True
+    for key, value in filter.items():
+        if isinstance(value, list):
+            if metadata.get(key) not in value:
+                return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+class IndexState:
+    """Index FAISS (wrapper LangChain), index BM25 et chunks masqués d'une génération.
+
+    L'état servi aux recherches n'est jamais modifié : une écriture travaille sur un brouillon,
+    copie privée de l'écrivain, qui remplace l'état servi d'une seule affectation à la publication.
+    """
+
+    def __init__(
+        self,
+        vector_store=None,
+        lexical_index: Optional[BM25Index] = None,
+        tombstones: Optional[Set[str]] = None,
+        built_spec: str = FLAT_SPEC,
+        generation: Optional[str] = None,
+        manifest: Optional[Dict] = None,
+        target_spec: Optional[str] = None
+    ):
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index if lexical_index is not None else BM25Index()
+        # Chunks supprimés mais encore présents dans un index qui ne sait pas retirer de vecteurs
+        self.tombstones = tombstones if tombstones is not None else set()
+        # Spec de l'index réellement construit (plat tant qu'il n'y a pas de quoi entraîner la spec voulue)
+        self.built_spec = built_spec
+        # Spec visée par cet index, choisie à sa création ou par une reconstruction explicite
+        self.target_spec = target_spec or built_spec
+        self.generation = generation
+        # Manifeste de l'ingesteur publié avec cet index (None pour un index écrit hors de l'ingesteur)
+        self.manifest = manifest
+
 class VectorStore:
-    def __init__(self, embeddings):
+    """Index FAISS + docstore + BM25, publiés en générations immuables (voir index_generations).
+
+    Chaque processus mappe en lecture seule la génération désignée par CURRENT et bascule sur la
+    suivante dès qu'un écrivain l'a publiée. Une écriture travaille sur un brouillon (index en mémoire,
+    docstore SQLite copié) que les recherches ne voient pas, et qui devient une nouvelle génération à save().
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        persist_path: Optional[str] = VECTOR_STORE_PATH,
+        engine: Optional[EmbeddingEngine] = None,
+        index_spec: str = VECTOR_INDEX_CONFIG["spec"],
+        refresh_interval: float = VECTOR_STORE_REFRESH_INTERVAL
+    ):
         self.embeddings = embeddings
-        self.vector_store = None
+        self.persist_path = persist_path
+        # Spec d'un nouvel index ; un index existant garde la spec visée enregistrée avec lui (target_spec)
+        self.index_spec = index_spec
+        self.engine = engine or EmbeddingEngine(embeddings)
+        self._analyzer: Optional[DocumentAnalyzer] = None
+        # État servi aux recherches, et brouillon de l'écriture en cours (None hors écriture)
+        self._state = IndexState()
+        self._draft: Optional[IndexState] = None
+        self.generations = GenerationStore(persist_path) if persist_path else None
+        # Dossier et docstore du brouillon
+        self._staging: Optional[str] = None
+        self._staging_docstore = None
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._generation_listeners: List[Callable[[], None]] = []
+        self._load()
 
-    def add_documents(self, documents: List[Document]) -> None:
+    @property
+    def vector_store(self):
+        return self._state.vector_store
+
+    @property
+    def lexical_index(self) -> BM25Index:
+        return self._state.lexical_index
+
+    @property
+    def tombstones(self) -> Set[str]:
+        return self._state.tombstones
+
+    @property
+    def built_spec(self) -> str:
+        return self._state.built_spec
+
+    @property
+    def target_spec(self) -> str:
+        return self._state.target_spec
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self._state.generation
+
+    @property
+    def manifest(self) -> Optional[Dict]:
+        return self._state.manifest
+
+    @property
+    def analyzer(self) -> DocumentAnalyzer:
+        if self._analyzer is None:
+            self._analyzer = DocumentAnalyzer()
+        return self._analyzer
+
+    def _working(self) -> IndexState:
+        """Brouillon de l'écriture en cours, sinon état servi"""
+        return self._draft if self._draft is not None else self._state
+
+    def _read_index(self, path: str, mmap: bool = True):
+        """Lit l'index FAISS, en mmap lorsque le type d'index le permet"""
+        faiss = faiss_module()
+        if mmap:
+            for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+                flag = getattr(faiss, flag_name, None)
+                if flag is None:
+                    continue
+                try:
+                    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+                except Exception:
+                    continue
+        return faiss.read_index(path), False
+
+    def _load(self) -> None:
+        """Charge la génération courante"""
+        if self.generations is None:
+            return
+        try:
+            name = self.generations.current()
+            if name is not None and name != self.generation:
+                self._open_generation(name)
+        except Exception as e:
+            logger.error(f"Impossible de charger le vector store persisté: {str(e)}")
+            self._state = IndexState()
+
+    def _open_generation(self, name: str, lexical_index: Optional[BM25Index] = None) -> None:
+        """Ouvre une génération publiée en lecture seule et la substitue à la génération servie"""
+        from langchain_community.vectorstores import FAISS
+        from src.rag.docstore import SQLiteDocstore
+        path = self.generations.path(name)
+        index, mmapped = self._read_index(os.path.join(path, INDEX_FILENAME))
+        apply_search_params(index)
+        docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILENAME))
+        with open(os.path.join(path, INDEX_META_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if lexical_index is None:
+            lexical_index = BM25Index.load(os.path.join(path, LEXICAL_INDEX_FILENAME))
+        manifest = None
+        if os.path.exists(os.path.join(path, MANIFEST_FILENAME)):
+            with open(os.path.join(path, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=docstore.index_ids()
+        )
+        # Bascule par une seule affectation : une recherche en cours garde l'ancien état (mmap, connexion
+        # SQLite), libéré quand plus rien ne le référence, sans copie en mémoire
+        self._state = IndexState(
+            vector_store=vector_store,
+            lexical_index=lexical_index,
+            tombstones=set(meta.get("tombstones", [])),
+            built_spec=meta["spec"],
+            generation=name,
+            manifest=manifest,
+            target_spec=meta["target_spec"]
+        )
+        logger.info(f"Génération {name} du vector store chargée ({index.ntotal} vecteurs, mmap={mmapped})")
+
+    def on_generation_change(self, callback: Callable[[], None]) -> None:
+        """Appelé quand ce processus bascule sur une génération publiée par un autre"""
+        self._generation_listeners.append(callback)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Bascule sur la dernière génération publiée ; au plus une vérification par refresh_interval"""
+        if self.generations is None or self._draft is not None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return False
+        # Une seule bascule à la fois ; les recherches concurrentes continuent sur la génération servie
+        if not self._refresh_lock.acquire(blocking=force):
+            return False
+        try:
+            self._last_refresh = now
+            name = self.generations.current()
+            if name is None or name == self.generation:
+                return False
+            self._open_generation(name)
+        finally:
+            self._refresh_lock.release()
+        for callback in self._generation_listeners:
+            callback()
+        return True
+
+    def lock_for_write(self) -> None:
+        """Prend le verrou d'écriture partagé entre processus et se place sur la dernière génération"""
+        if self.generations is None:
+            return
+        self.generations.lock.acquire()
+        self.refresh(force=True)
+
+    def unlock_for_write(self) -> None:
+        """Abandonne les modifications non publiées (écriture interrompue) et rend le verrou"""
+        if self.generations is None:
+            return
+        try:
+            self.discard_changes()
+        finally:
+            self.generations.lock.release()
+
+    @contextmanager
+    def writing(self):
+        """Verrou d'écriture pour les usages synchrones (CLI)"""
+        self.lock_for_write()
+        try:
+            yield self
+        finally:
+            self.unlock_for_write()
+
+    def _ensure_writable(self) -> IndexState:
+        """Brouillon de l'écriture en cours, créé à la première modification comme copie de l'état servi
+        (index chargé en mémoire, docstore copié) ; l'état servi n'est jamais modifié"""
+        if self._draft is not None:
+            return self._draft
+        from langchain_community.vectorstores import FAISS
+        served = self._state
+        draft = IndexState(
+            lexical_index=served.lexical_index.copy(),
+            tombstones=set(served.tombstones),
+            built_spec=served.built_spec,
+            generation=served.generation,
+            manifest=served.manifest,
+            target_spec=served.target_spec
+        )
+        source = served.vector_store.docstore if served.vector_store is not None else None
+        if self.generations is not None:
+            from src.rag.docstore import SQLiteDocstore
+            self._staging = self.generations.new_staging()
+            self._staging_docstore = SQLiteDocstore.create(os.path.join(self._staging, DOCSTORE_FILENAME), source=source)
+        else:
+            from langchain_community.docstore.in_memory import InMemoryDocstore
+            self._staging_docstore = InMemoryDocstore(dict(source._dict) if source is not None else {})
+        if served.vector_store is not None:
+            if served.generation is not None:
+                index, _ = self._read_index(os.path.join(self.generations.path(served.generation), INDEX_FILENAME), mmap=False)
+            else:
+                index = faiss_module().clone_index(served.vector_store.index)
+            apply_search_params(index)
+            draft.vector_store = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=self._staging_docstore,
+                index_to_docstore_id=dict(served.vector_store.index_to_docstore_id.items())
+            )
+        self._draft = draft
+        return draft
+
+    def discard_changes(self) -> None:
+        """Abandonne le brouillon si une écriture n'a pas été sauvegardée ; l'état servi est inchangé"""
+        if self._draft is None and self._staging is None:
+            return
+        logger.warning("Modifications du vector store non publiées, abandonnées")
+        if self._staging is not None:
+            self._staging_docstore.close()
+            self.generations.discard(self._staging)
+        self._draft = None
+        self._staging = None
+        self._staging_docstore = None
+
+    def save(self, manifest: Optional[Dict] = None) -> None:
+        """Publie le brouillon : fichiers écrits à part puis bascule atomique de CURRENT.
+
+        Une génération complète est écrite à chaque appel : les écrivains regroupent toutes les
+        modifications d'une opération (ingestion, sync) dans un seul brouillon et publient une fois.
+        manifest : manifeste de l'ingesteur, publié dans la même génération que l'index (à défaut,
+        celui de la génération servie est repris).
+        """
+        draft = self._draft
+        if draft is None or draft.vector_store is None:
+            if manifest is not None and manifest != self._state.manifest:
+                self._publish_manifest(manifest)
+            return
+        if manifest is not None:
+            draft.manifest = manifest
+        self._maybe_rebuild()
+        if self.generations is None:
+            # Sans persistance, publier revient à servir le brouillon
+            self._state = draft
+            self._draft = None
+            self._staging_docstore = None
+            return
+        faiss = faiss_module()
+        faiss.write_index(draft.vector_store.index, os.path.join(self._staging, INDEX_FILENAME))
+        self._staging_docstore.write_index_ids(draft.vector_store.index_to_docstore_id)
+        self._staging_docstore.close()
+        draft.lexical_index.save(os.path.join(self._staging, LEXICAL_INDEX_FILENAME))
+        _write_json(
+            os.path.join(self._staging, INDEX_META_FILENAME),
+            {"spec": draft.built_spec, "target_spec": draft.target_spec, "tombstones": sorted(draft.tombstones)}
+        )
+        if draft.manifest is not None:
+            _write_json(os.path.join(self._staging, MANIFEST_FILENAME), draft.manifest)
+        name = self.generations.publish(self._staging)
+        self._draft = None
+        self._staging = None
+        self._staging_docstore = None
+        # L'écrivain repasse lui aussi en lecture seule sur la génération publiée
+        self._open_generation(name, lexical_index=draft.lexical_index)
+        logger.info(f"Vector store publié en génération {name} dans {self.persist_path}")
+
+    def _publish_manifest(self, manifest: Dict) -> None:
+        """Publie une génération dont seul le manifeste change : les fichiers de l'index servi,
+        immuables, y sont liés au lieu d'être copiés"""
+        served = self._state
+        if self.generations is None:
+            self._state = IndexState(
+                vector_store=served.vector_store,
+                lexical_index=served.lexical_index,
+                tombstones=served.tombstones,
+                built_spec=served.built_spec,
+                generation=served.generation,
+                manifest=manifest,
+                target_spec=served.target_spec
+            )
+            return
+        if served.generation is None:
+            return
+        staging = self.generations.new_staging()
         try:
-            # Vérifier et nettoyer les documents
-            valid_documents = []
-            for doc in documents:
-                if hasattr(doc, 'page_content') and isinstance(doc.page_content, str) and doc.page_content.strip():
-                    valid_documents.append(Document(
-                        page_content=doc.page_content,
-                        metadata=doc.metadata if hasattr(doc, 'metadata') else {}
-                    ))
-            
+            self.generations.link_files(served.generation, staging, INDEX_FILENAMES)
+            _write_json(os.path.join(staging, MANIFEST_FILENAME), manifest)
+            name = self.generations.publish(staging)
+        except Exception:
+            self.generations.discard(staging)
+            raise
+        self._open_generation(name, lexical_index=served.lexical_index)
+        logger.info(f"Manifeste publié en génération {name}")
+
+    def _clean_documents(self, documents: List[Document]) -> List[Document]:
+        """Vérifie et nettoie les documents"""
+        valid_documents = []
+        for doc in documents:
+            if hasattr(doc, 'page_content') and isinstance(doc.page_content, str) and doc.page_content.strip():
+                valid_documents.append(Document(
+                    page_content=doc.page_content,
+                    metadata=doc.metadata if hasattr(doc, 'metadata') else {}
+                ))
+        return valid_documents
+
+    def _add_embeddings(self, documents: List[Document], vectors: List[List[float]]) -> None:
+        text_embeddings = [(doc.page_content, vector) for doc, vector in zip(documents, vectors)]
+        metadatas = [doc.metadata for doc in documents]
+        ids = [doc.metadata["chunk_id"] for doc in documents]
+        draft = self._ensure_writable()
+        if draft.vector_store is None:
+            from langchain_community.vectorstores import FAISS
+            index, draft.built_spec = self._empty_index(len(vectors[0]))
+            draft.target_spec = self.index_spec
+            draft.vector_store = FAISS(
+                embedding_function=self.embeddings,
+                index=index,
+                docstore=self._staging_docstore,
+                index_to_docstore_id={}
+            )
+        draft.vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    def _empty_index(self, dimension: int):
+        """(index, spec) : index de la spec voulue, ou index plat si elle doit d'abord être entraînée"""
+        if needs_training(self.index_spec, dimension):
+            faiss = faiss_module()
+            logger.info(f"Index {self.index_spec} en attente d'entraînement, index plat en attendant")
+            return faiss.IndexFlatL2(dimension), FLAT_SPEC
+        return build_index(self.index_spec, np.empty((0, dimension), dtype=np.float32)), self.index_spec
+
+    def stored_vectors(self, state: Optional[IndexState] = None):
+        """(positions et ids conservés, vecteurs) des chunks non supprimés, dans l'ordre de l'index"""
+        faiss = faiss_module()
+        state = state or self._working()
+        kept = [
+            (position, doc_id)
+            for position, doc_id in sorted(state.vector_store.index_to_docstore_id.items())
+            if doc_id not in state.tombstones
+        ]
+        index = state.vector_store.index
+        if isinstance(index, faiss.IndexFlat):
+            vectors = index.reconstruct_n(0, index.ntotal)[[position for position, _ in kept]]
+        else:
+            # Index compressé : on repart des textes, par lots bornés, servis par le cache d'embeddings
+            texts = [state.vector_store.docstore.search(doc_id).page_content for _, doc_id in kept]
+            vectors = np.asarray(self.engine.embed_documents(texts), dtype=np.float32)
+        return kept, vectors
+
+    def rebuild(self, spec: Optional[str] = None) -> None:
+        """Reconstruit (et entraîne si besoin) l'index avec une autre spec, qui devient sa spec visée.
+
+        Les vecteurs d'un index plat sont relus ; ceux d'un index compressé sont recalculés par lots
+        (voir stored_vectors).
+        """
+        if self._working().vector_store is None:
+            return
+        spec = spec or self.index_spec
+        draft = self._ensure_writable()
+        draft.target_spec = spec
+        kept, vectors = self.stored_vectors(draft)
+        if not kept:
+            return
+        started = time.perf_counter()
+        index = build_index(spec, vectors)
+        if draft.tombstones:
+            draft.vector_store.docstore.delete(list(draft.tombstones))
+        draft.vector_store.index = index
+        draft.vector_store.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(kept)}
+        draft.tombstones = set()
+        draft.built_spec = spec
+        logger.info(f"Index reconstruit en {spec} ({len(kept)} vecteurs, {time.perf_counter() - started:.1f}s)")
+
+    def _maybe_rebuild(self) -> None:
+        """Quitte l'index plat d'attente pour la spec visée dès qu'il y a assez de vecteurs pour l'entraîner.
+        La spec visée est celle enregistrée avec l'index : VECTOR_INDEX_SPEC ne défait pas un rebuild --spec"""
+        draft = self._draft
+        if draft is None or draft.vector_store is None or draft.built_spec != FLAT_SPEC or draft.target_spec == FLAT_SPEC:
+            return
+        live_vectors = draft.vector_store.index.ntotal - len(draft.tombstones)
+        if live_vectors >= min_training_vectors(draft.target_spec):
+            self.rebuild(draft.target_spec)
+
+    async def aadd_documents(
+        self,
+        documents: List[Document],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> None:
+        """Indexe chaque lot dans le brouillon dès que ses embeddings sont prêts ; publié par save()"""
+        try:
+            valid_documents = self._clean_documents(documents)
             if not valid_documents:
                 logger.warning("No valid documents to add to vector store")
                 return
 
-            # Créer ou mettre à jour le vector store
-            if self.vector_store is None:
-                self.vector_store = FAISS.from_documents(valid_documents, self.embeddings)
-            else:
-                self.vector_store.add_documents(valid_documents)
-                
+            for doc in valid_documents:
+                doc.metadata.setdefault("chunk_id", str(uuid.uuid4()))
+
+            texts = [doc.page_content for doc in valid_documents]
+            # La tokenisation lexicale tourne dans un thread pendant le calcul des embeddings
+            terms_task = asyncio.create_task(
+                asyncio.to_thread(lambda: [self.analyzer.terms(text) for text in texts])
+            )
+            async for offset, vectors in self.engine.embed_stream(texts, progress):
+                self._add_embeddings(valid_documents[offset:offset + len(vectors)], vectors)
+
+            draft = self._ensure_writable()
+            for doc, terms in zip(valid_documents, await terms_task):
+                draft.lexical_index.add(doc.metadata["chunk_id"], terms)
+
             logger.info(f"Added {len(valid_documents)} documents to vector store")
         except Exception as e:
             logger.error(f"Error adding documents to vector store: {str(e)}")
             raise
+
+    def add_documents(self, documents: List[Document]) -> None:
+        """Indexe et publie aussitôt (scripts) ; les écrivains concurrents passent par writing()"""
+        asyncio.run(self.aadd_documents(documents))
+        self.save()
+
+    def chunk_ids_by_content(self) -> Dict[str, List[str]]:
+        """Parcourt le docstore : hash du contenu -> ids des chunks ("" pour les chunks sans content_hash)"""
+        result: Dict[str, List[str]] = {}
+        state = self._working()
+        if state.vector_store is None:
+            return result
+        for doc_id in state.vector_store.index_to_docstore_id.values():
+            if doc_id in state.tombstones:
+                continue
+            doc = state.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                result.setdefault(doc.metadata.get("content_hash") or "", []).append(doc_id)
+        return result
+
+    @staticmethod
+    def _supports_remove(state: IndexState) -> bool:
+        """Seuls les index plats renumérotent leurs vecteurs comme le suppose FAISS.delete de LangChain"""
+        faiss = faiss_module()
+        return isinstance(state.vector_store.index, faiss.IndexFlat)
+
+    def delete(self, chunk_ids: Iterable[str]) -> List[Document]:
+        """Supprime des chunks de l'index vectoriel, du docstore et de l'index BM25 ; retourne les chunks supprimés"""
+        state = self._working()
+        if state.vector_store is None:
+            return []
+        known_ids = set(state.vector_store.index_to_docstore_id.values())
+        ids = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id in known_ids and chunk_id not in state.tombstones]
+        if not ids:
+            return []
+        draft = self._ensure_writable()
+        deleted = [doc for doc in map(draft.vector_store.docstore.search, ids) if isinstance(doc, Document)]
+        for chunk_id in ids:
+            draft.lexical_index.remove(chunk_id)
+
+        if self._supports_remove(draft):
+            draft.vector_store.delete(ids)
+        else:
+            # L'index ne sait pas retirer de vecteurs : on les masque jusqu'à la prochaine compaction
+            draft.tombstones.update(ids)
+            if len(draft.tombstones) > VECTOR_STORE_COMPACTION_RATIO * draft.vector_store.index.ntotal:
+                self.compact()
+        logger.info(f"{len(ids)} chunks supprimés du vector store")
+        return deleted
+
+    def compact(self) -> None:
+        """Reconstruit l'index sans les vecteurs marqués comme supprimés"""
+        state = self._working()
+        if state.vector_store is None or not state.tombstones:
+            return
+        faiss = faiss_module()
+        draft = self._ensure_writable()
+        index = draft.vector_store.index
+        if hasattr(index, "make_direct_map"):
+            # Les index IVF ne savent reconstruire un vecteur qu'avec une table directe
+            index.make_direct_map()
+        kept = [
+            (position, doc_id)
+            for position, doc_id in sorted(draft.vector_store.index_to_docstore_id.items())
+            if doc_id not in draft.tombstones
+        ]
+        new_index = faiss.clone_index(index)
+        new_index.reset()
+        if kept:
+            new_index.add(np.vstack([index.reconstruct(position) for position, _ in kept]))
+        draft.vector_store.docstore.delete(list(draft.tombstones))
+        draft.vector_store.index = new_index
+        draft.vector_store.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(kept)}
+        logger.info(f"Vector store compacté: {len(draft.tombstones)} vecteurs retirés, {len(kept)} conservés")
+        draft.tombstones = set()
+
+    @staticmethod
+    def _without_tombstones(docs: List[Document], tombstones: Set[str]) -> List[Document]:
+        if not tombstones:
+            return docs
+        return [doc for doc in docs if doc.metadata.get("chunk_id") not in tombstones]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        self.refresh()
+        state = self._state
+        if state.vector_store is None:
+            return []
+        return self._without_tombstones(state.vector_store.similarity_search(query, k=k, **kwargs), state.tombstones)
+
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict] = None,
+        fetch_k: int = 20,
+        rrf_k: int = 60
+    ) -> List[Document]:
+        """Fusionne la recherche vectorielle et BM25 par reciprocal rank fusion"""
+        self.refresh()
+        # État pris une fois : une bascule de génération pendant la recherche ne mélange pas deux états
+        state = self._state
+        if state.vector_store is None:
+            return []
+        with timed("query_embedding"):
+            query_vector = self.embeddings.embed_query(query)
+        with timed("vector_search"):
+            return self._fused_search(state, query, query_vector, k, filter, max(fetch_k, k), rrf_k)
+
+    def warm_up(self, query: str, query_vector: List[float]) -> None:
+        """Recherche factice : charge NLTK et amène en mémoire les pages de l'index mmappé"""
+        self.analyzer.terms(query)
+        state = self._state
+        if state.vector_store is not None:
+            self._fused_search(state, query, query_vector, 1, None, 4, 60)
+
+    @staticmethod
+    def _lexical_filter(state: IndexState, filter: Optional[Dict]) -> Optional[Callable[[str], bool]]:
+        """Filtre des postings BM25 : le filtre sur content_hash passe par la colonne indexée du docstore
+        (chunks des contenus demandés seulement), les autres clés par les métadonnées du chunk"""
+        if not filter:
+            return None
+        from src.rag.docstore import SQLiteDocstore
+        docstore = state.vector_store.docstore
+        filter = dict(filter)
+        allowed_ids = None
+        if "content_hash" in filter:
+            value = filter.pop("content_hash")
+            content_hashes = value if isinstance(value, list) else [value]
+            if isinstance(docstore, SQLiteDocstore):
+                allowed_ids = docstore.ids_with_content(content_hashes)
+            else:
+                allowed_ids = {
+                    doc_id for doc_id, doc in docstore._dict.items()
+                    if doc.metadata.get("content_hash") in content_hashes
+                }
+
+        def allowed(doc_id: str) -> bool:
+            if allowed_ids is not None and doc_id not in allowed_ids:
+                return False
+            if not filter:
+                return True
+            doc = docstore.search(doc_id)
+            return isinstance(doc, Document) and matches_filter(doc.metadata, filter)
+
+        return allowed
+
+    def _fused_search(
+        self,
+        state: IndexState,
+        query: str,
+        query_vector: List[float],
+        k: int,
+        filter: Optional[Dict],
+        fetch_k: int,
+        rrf_k: int
+    ) -> List[Document]:
+        dense_docs = self._without_tombstones(state.vector_store.similarity_search_by_vector(
+            query_vector, k=fetch_k, filter=filter, fetch_k=fetch_k * 4
+        ), state.tombstones)
+        docstore = state.vector_store.docstore
+        lexical_hits = state.lexical_index.search(
+            self.analyzer.terms(query), fetch_k, self._lexical_filter(state, filter)
+        )
+
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+        for rank, doc in enumerate(dense_docs):
+            doc_id = doc.metadata.get("chunk_id") or getattr(doc, "id", None) or doc.page_content
+            documents[doc_id] = doc
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        for rank, (doc_id, _) in enumerate(lexical_hits):
+            if doc_id not in documents:
+                doc = docstore.search(doc_id)
+                if not isinstance(doc, Document):
+                    continue
+                documents[doc_id] = doc
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [documents[doc_id] for doc_id in ranked]
@@ -1,9 +1,8 @@
-import os
-import ast
-from rag.document_loader import DocumentLoader
-from rag.embeddings import EmbeddingManager
-from rag.vector_store import VectorStore
-from rag.chat import RAGChat
+from langchain_core.documents import Document
+from src.rag.embeddings import EmbeddingManager
+from src.rag.ingestion import DocumentIngestor
+from src.rag.vector_store import VectorStore
+from src.rag.chat import RAGChat
 
 def test_rag():
     try:
@@ -20,22 +19,20 @@ def test_rag():
             Cette approche permet d'obtenir des réponses plus précises.
             """
         }
-        
-        for filename, content in test_files.items():
-            with open(filename, "w", encoding='utf-8') as f:
-                f.write(content)
 
         # Initialiser les composants
         print("🔄 Initialisation des composants...")
-        loader = DocumentLoader()
         embedding_manager = EmbeddingManager()
         vector_store = VectorStore(embedding_manager.get_embeddings())
-        
-        # Charger tous les documents
+        ingestor = DocumentIngestor(vector_store)
+
+        # Analyser puis découper les documents, comme l'ingestion
         print("📚 Chargement des documents...")
+        documents = [Document(page_content=content) for content in test_files.values()]
+        ingestor.analyze_documents(documents)
         all_documents = []
-        for filename in test_files.keys():
-            docs = loader.load_text(filename)
+        for filename, document in zip(test_files, documents):
+            docs = ingestor.split_documents([document], filename)
             all_documents.extend(docs)
             print(f"✅ Document {filename} découpé en {len(docs)} chunks")
 
@@ -44,12 +41,12 @@ def test_rag():
         for doc in all_documents:
             print(f"\n📄 Document: {doc.metadata['filename']}")
             print(f"📈 Statistiques:")
-            stats = ast.literal_eval(doc.metadata['stats'])
+            stats = doc.metadata['stats']
             for key, value in stats.items():
                 print(f"  - {key}: {value}")
             print(f"🏷️  Tags: {doc.metadata['tags']}")
             print(f"📊 Complexité:")
-            complexity = ast.literal_eval(doc.metadata['complexity'])
+            complexity = doc.metadata['complexity']
             for key, value in complexity.items():
                 print(f"  - {key}: {value}")
 
@@ -90,11 +87,6 @@ def test_rag():
         new_chat.load_history(rag_chat.conversation_id)
         print(f"\n📖 Historique chargé: {len(new_chat.conversation_history)} messages")
 
-        # Nettoyage
-        for filename in test_files.keys():
-            os.remove(filename)
-        print("\n🧹 Nettoyage effectué")
-
     except Exception as e:
         print("❌ Erreur:", str(e))
 
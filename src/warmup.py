@@ -0,0 +1,106 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from src.config import WARMUP_CONFIG
+from src.llm.ollama_client import OllamaClient
+from src.llm.scheduler import PRIORITY_INTERACTIVE
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = "préchauffage"
+
+class Warmup:
+    """Préchauffage lancé en tâche de fond par le lifespan ; /ready attend qu'il soit terminé.
+
+    Un échec d'étape est journalisé et visible dans status() mais ne bloque pas la disponibilité :
+    le préchauffage ne fait qu'éviter que la première requête paie les chargements.
+    """
+
+    def __init__(
+        self,
+        ollama_client: OllamaClient,
+        vector_store,
+        enabled: bool = WARMUP_CONFIG["enabled"],
+        timeout: float = WARMUP_CONFIG["timeout"]
+    ):
+        self.ollama_client = ollama_client
+        self.vector_store = vector_store
+        self.enabled = enabled
+        self.timeout = timeout
+        # étape -> {"status": pending|ok|failed, "seconds", "error"}
+        self.steps: Dict[str, Dict] = {}
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._query_vector: Optional[List[float]] = None
+
+    def start(self) -> None:
+        if not self.enabled:
+            self.ready.set()
+            return
+        for name, _ in self._plan():
+            self.steps[name] = {"status": "pending"}
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _plan(self) -> List[Tuple[str, Callable[[], Awaitable[None]]]]:
+        return [
+            ("model", self._preload_model),
+            ("embedding", self._embed),
+            ("index", self._search_index)
+        ]
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        plan = self._plan()
+        for name, _ in plan:
+            self.steps.setdefault(name, {"status": "pending"})
+        try:
+            await asyncio.wait_for(self._run_steps(plan), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Préchauffage interrompu après {self.timeout}s")
+            for step in self.steps.values():
+                if step["status"] == "pending":
+                    step.update(status="failed", error="timeout")
+        finally:
+            self.ready.set()
+        logger.info(f"Préchauffage terminé en {time.perf_counter() - started:.2f}s")
+
+    async def _run_steps(self, plan: List[Tuple[str, Callable[[], Awaitable[None]]]]) -> None:
+        for name, step in plan:
+            started = time.perf_counter()
+            try:
+                await step()
+                self.steps[name].update(status="ok")
+            except Exception as e:
+                logger.warning(f"Étape de préchauffage '{name}' échouée: {str(e)}")
+                self.steps[name].update(status="failed", error=str(e))
+            self.steps[name]["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def _preload_model(self) -> None:
+        # Modèle de génération chargé et maintenu en mémoire par Ollama (keep_alive)
+        await self.ollama_client.preload()
+
+    async def _embed(self) -> None:
+        # Appel direct, sans cache d'embeddings, pour charger réellement le modèle d'embedding
+        vectors = await self.ollama_client.embed([WARMUP_QUERY], priority=PRIORITY_INTERACTIVE)
+        self._query_vector = vectors[0]
+
+    async def _search_index(self) -> None:
+        if self._query_vector is None:
+            # Sans vecteur de requête, seules les ressources lexicales sont chargées
+            await asyncio.to_thread(self.vector_store.analyzer.terms, WARMUP_QUERY)
+            return
+        await asyncio.to_thread(self.vector_store.warm_up, WARMUP_QUERY, self._query_vector)
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready.is_set(),
+            "enabled": self.enabled,
+            "steps": self.steps
+        }
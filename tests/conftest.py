@@ -0,0 +1,36 @@
+import hashlib
+from typing import List
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+class HashEmbeddings(Embeddings):
+    """Embeddings déterministes et hors ligne : 8 dimensions tirées du sha256 du texte"""
+
+    def _vector(self, text: str) -> List[float]:
+        return [byte / 255 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:8]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+class WhitespaceAnalyzer:
+    """Découpage minimal pour l'index BM25, sans les ressources NLTK de DocumentAnalyzer"""
+
+    def terms(self, text: str) -> List[str]:
+        return text.lower().split()
+
+@pytest.fixture
+def make_vector_store(tmp_path):
+    """Fabrique des VectorStore partageant le même dossier persisté, comme plusieurs workers"""
+    from src.rag.vector_store import VectorStore
+
+    def make(**kwargs):
+        kwargs.setdefault("refresh_interval", 0)
+        vector_store = VectorStore(HashEmbeddings(), persist_path=str(tmp_path / "vector_store"), **kwargs)
+        vector_store._analyzer = WhitespaceAnalyzer()
+        return vector_store
+
+    return make
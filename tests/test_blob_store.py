@@ -0,0 +1,59 @@
+import hashlib
+
+from src.cloud_storage.blob_store import LocalBlobStore
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def test_same_content_is_stored_once(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+
+    first, first_duplicate = store.put_bytes("rapport.pdf", b"contenu")
+    second, second_duplicate = store.put_bytes("copie.pdf", b"contenu")
+
+    assert first == second == sha256(b"contenu")
+    assert (first_duplicate, second_duplicate) == (False, True)
+    assert store.resolve("rapport.pdf") == store.resolve("copie.pdf") == first
+    assert len([path for path in (tmp_path / "blobs").rglob("*") if path.is_file()]) == 1
+
+def test_blob_is_kept_while_another_name_refers_to_it(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    digest, _ = store.put_bytes("rapport.pdf", b"contenu")
+    store.put_bytes("copie.pdf", b"contenu")
+
+    store.remove("rapport.pdf")
+    assert store.has_blob(digest)
+    assert store.get_bytes(digest) == b"contenu"
+
+    store.remove("copie.pdf")
+    assert not store.has_blob(digest)
+    assert store.manifest() == {}
+
+def test_overwritten_content_is_collected(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    old, _ = store.put_bytes("rapport.pdf", b"version 1")
+    new, _ = store.put_bytes("rapport.pdf", b"version 2")
+
+    assert store.resolve("rapport.pdf") == new
+    assert store.has_blob(new)
+    assert not store.has_blob(old)
+
+def test_commit_file_drops_duplicate_upload(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    digest, _ = store.put_bytes("rapport.pdf", b"contenu")
+    upload = tmp_path / "upload.part"
+    upload.write_bytes(b"contenu")
+
+    assert store.commit_file("copie.pdf", str(upload), digest)
+    assert not upload.exists()
+    assert store.resolve("copie.pdf") == digest
+
+def test_manifest_is_shared_between_instances(tmp_path):
+    writer = LocalBlobStore(str(tmp_path))
+    reader = LocalBlobStore(str(tmp_path))
+
+    digest, _ = writer.put_bytes("rapport.pdf", b"contenu")
+    reader.remove("rapport.pdf")
+
+    assert writer.resolve("rapport.pdf") is None
+    assert not writer.has_blob(digest)
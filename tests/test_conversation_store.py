@@ -0,0 +1,53 @@
+import pytest
+
+from src.rag.conversation_store import Conversation, ConversationStore, InvalidCursorError
+
+@pytest.fixture
+def conversation_store(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations"))
+    yield store
+    store.close()
+
+def add_conversation(store: ConversationStore, conversation_id: str, timestamp: str) -> None:
+    messages = [{"role": "user", "content": f"question {conversation_id}", "timestamp": timestamp}]
+    store.save_conversation(Conversation(id=conversation_id, messages=messages))
+
+def walk_pages(store: ConversationStore, limit: int):
+    pages, cursor = [], None
+    while True:
+        page = store.list_conversations_page(limit, cursor)
+        pages.append([conversation["id"] for conversation in page["conversations"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+def test_pages_follow_last_activity(conversation_store):
+    for day in range(1, 6):
+        add_conversation(conversation_store, f"c{day}", f"2026-01-0{day}T10:00:00")
+
+    assert walk_pages(conversation_store, 2) == [["c5", "c4"], ["c3", "c2"], ["c1"]]
+
+def test_same_activity_is_ordered_by_id_without_gaps(conversation_store):
+    for conversation_id in ("a", "b", "c", "d"):
+        add_conversation(conversation_store, conversation_id, "2026-01-01T10:00:00")
+
+    assert walk_pages(conversation_store, 3) == [["d", "c", "b"], ["a"]]
+
+def test_updated_conversation_moves_to_the_first_page(conversation_store):
+    add_conversation(conversation_store, "ancienne", "2026-01-01T10:00:00")
+    add_conversation(conversation_store, "recente", "2026-01-02T10:00:00")
+    conversation_store.save_message("ancienne", "assistant", "réponse")
+
+    first_page = conversation_store.list_conversations_page(1)
+    assert [conversation["id"] for conversation in first_page["conversations"]] == ["ancienne"]
+    assert first_page["conversations"][0]["messageCount"] == 2
+
+def test_last_page_has_no_cursor(conversation_store):
+    add_conversation(conversation_store, "seule", "2026-01-01T10:00:00")
+
+    assert conversation_store.list_conversations_page(1)["next_cursor"] is None
+
+@pytest.mark.parametrize("cursor", ["pas-du-base64!", "c2Fucy1zZXBhcmF0ZXVy"])
+def test_invalid_cursor_is_rejected(conversation_store, cursor):
+    with pytest.raises(InvalidCursorError):
+        conversation_store.list_conversations_page(10, cursor)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+def chunks(*chunk_ids: str, content_hash: str = "h1"):
+    return [
+        Document(page_content=f"contenu du chunk {chunk_id}", metadata={"chunk_id": chunk_id, "content_hash": content_hash})
+        for chunk_id in chunk_ids
+    ]
+
+def add(vector_store, documents):
+    with vector_store.writing():
+        asyncio.run(vector_store.aadd_documents(documents))
+        vector_store.save()
+
+def chunk_ids(vector_store):
+    return sorted(doc.metadata["chunk_id"] for doc in vector_store.similarity_search("contenu", k=50))
+
+def test_save_publishes_one_generation(make_vector_store):
+    writer = make_vector_store()
+    assert writer.generation is None
+
+    add(writer, chunks("a", "b", "c"))
+
+    assert writer.generation is not None
+    assert writer.generations.current() == writer.generation
+    assert chunk_ids(writer) == ["a", "b", "c"]
+    assert writer.chunk_ids_by_content() == {"h1": ["a", "b", "c"]}
+
+def test_reader_refreshes_to_the_published_generation(make_vector_store):
+    writer = make_vector_store()
+    reader = make_vector_store()
+    changes = []
+    reader.on_generation_change(lambda: changes.append(reader.generation))
+
+    add(writer, chunks("a", "b"))
+    assert chunk_ids(reader) == ["a", "b"]
+
+    with writer.writing():
+        writer.delete(["a"])
+        writer.save()
+    assert chunk_ids(reader) == ["b"]
+    assert reader.generation == writer.generation
+    assert len(changes) == 2
+
+def test_unsaved_write_is_discarded(make_vector_store):
+    writer = make_vector_store()
+    add(writer, chunks("a", "b"))
+    published = writer.generation
+
+    with writer.writing():
+        writer.delete(["a"])
+
+    assert writer.generation == published
+    assert writer.generations.current() == published
+    assert chunk_ids(writer) == ["a", "b"]
+
+def test_failed_write_publishes_nothing(make_vector_store):
+    writer = make_vector_store()
+    add(writer, chunks("a"))
+    published = writer.generation
+
+    with pytest.raises(RuntimeError):
+        with writer.writing():
+            asyncio.run(writer.aadd_documents(chunks("b")))
+            raise RuntimeError("ingestion interrompue")
+
+    reopened = make_vector_store()
+    assert reopened.generation == published
+    assert chunk_ids(reopened) == ["a"]
+
+def test_manifest_only_change_links_index_files(make_vector_store):
+    from src.rag.vector_store import INDEX_FILENAME
+
+    writer = make_vector_store()
+    add(writer, chunks("a"))
+    previous = writer.generation
+
+    with writer.writing():
+        writer.save(manifest={"a.pdf": "h1"})
+
+    assert writer.generation != previous
+    assert make_vector_store().manifest == {"a.pdf": "h1"}
+    index_path = os.path.join(writer.generations.path(writer.generation), INDEX_FILENAME)
+    assert os.stat(index_path).st_nlink == 2
+
+def test_rebuild_spec_survives_reopening(make_vector_store):
+    writer = make_vector_store(index_spec="Flat")
+    add(writer, chunks("a", "b", "c"))
+
+    with writer.writing():
+        writer.rebuild("HNSW8")
+        writer.save()
+
+    # VECTOR_INDEX_SPEC (ici Flat) ne défait pas la spec choisie explicitement
+    reopened = make_vector_store(index_spec="Flat")
+    add(reopened, chunks("d", content_hash="h2"))
+    assert reopened.built_spec == "HNSW8"
+    assert reopened.target_spec == "HNSW8"
+    assert chunk_ids(reopened) == ["a", "b", "c", "d"]
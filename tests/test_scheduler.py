@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from src.llm.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMScheduler, SchedulerOverloaded
+
+MODEL = "llama3"
+
+async def hold_slot(scheduler: LLMScheduler, released: asyncio.Event, priority: int = PRIORITY_INTERACTIVE):
+    async with scheduler.slot(MODEL, priority):
+        await released.wait()
+
+def test_released_slot_is_handed_to_the_interactive_waiter_first():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=5)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(scheduler, released))
+        await asyncio.sleep(0)
+
+        order = []
+
+        async def wait(name: str, priority: int):
+            async with scheduler.slot(MODEL, priority):
+                order.append(name)
+
+        batch = asyncio.create_task(wait("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(wait("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert scheduler.stats()[MODEL]["queued"] == 2
+
+        released.set()
+        await asyncio.gather(holder, batch, interactive)
+        return order, scheduler.stats()[MODEL]
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["interactive", "batch"]
+    # La place est transmise sans être rendue entre deux requêtes
+    assert stats["active"] == 0
+    assert stats["admitted"] == 3
+
+def test_interactive_waiter_times_out_and_slot_is_not_leaked():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(scheduler, released))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloaded) as error:
+            async with scheduler.slot(MODEL):
+                pass
+
+        released.set()
+        await holder
+        async with scheduler.slot(MODEL):
+            pass
+        return error.value, scheduler.stats()[MODEL]
+
+    error, stats = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert stats["timed_out"] == 1
+    assert stats["active"] == 0
+
+def test_batch_waiter_ignores_interactive_timeout():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(scheduler, released))
+        await asyncio.sleep(0)
+
+        batches = [asyncio.create_task(hold_slot(scheduler, asyncio.Event(), PRIORITY_BATCH)) for _ in range(3)]
+        await asyncio.sleep(0.2)
+        waiting = [not task.done() for task in batches]
+        for task in batches:
+            task.cancel()
+        released.set()
+        await asyncio.gather(holder, *batches, return_exceptions=True)
+        return waiting, scheduler.stats()[MODEL]
+
+    waiting, stats = asyncio.run(scenario())
+    assert waiting == [True, True, True]
+    assert stats["timed_out"] == 0
+    assert stats["active"] == 0
+
+def test_full_queue_rejects_interactive_requests():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1, queue_timeout=5)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(scheduler, released))
+        waiter = asyncio.create_task(hold_slot(scheduler, released))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloaded) as error:
+            scheduler.check_admission(MODEL)
+
+        released.set()
+        await asyncio.gather(holder, waiter)
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+
+def test_cancelled_waiter_is_skipped_at_handoff():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=5)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold_slot(scheduler, released))
+        await asyncio.sleep(0)
+
+        cancelled = asyncio.create_task(hold_slot(scheduler, asyncio.Event()))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        queued = scheduler.stats()[MODEL]["queued"]
+
+        released.set()
+        await holder
+        # La place n'est pas transmise à l'attente annulée : elle est rendue
+        idle = scheduler.stats()[MODEL]["active"]
+        async with scheduler.slot(MODEL):
+            pass
+        return cancelled.cancelled(), queued, idle
+
+    was_cancelled, queued, idle = asyncio.run(scenario())
+    assert was_cancelled
+    assert queued == 0
+    assert idle == 0